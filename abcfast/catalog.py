@@ -0,0 +1,197 @@
+import csv
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import numpy as np
+from abcfast import kernelcache
+
+#Cached columnar ingest of CSV catalogs (e.g. data/kepler_berger.csv, data/koi_berger.csv).
+#
+#On the first read, the CSV is converted to one float32 binary file per column in
+#<cache dir>/catalog/<sha256 of the CSV>/ (cache dir: ABCFAST_CACHE_DIR or ~/.cache/abcfast).
+#A text column is stored as float32 codes with the list of the categories in columns.json.
+#The CSV is parsed in chunks of rows written column by column, so only one chunk is held in memory.
+#The sha256 is recorded in a stamp keyed by (realpath, size, mtime_ns) in <cache dir>/catalog/stamps/,
+#so later reads only stat the CSV and memory-map the requested columns; the CSV is hashed again
+#only when the stamp changes.
+#
+#   cat=Catalog("data/kepler_berger.csv")
+#   mask=cat.finite(names)&cat.within("teffnew",4000.0,7000.0)&(cat["logg"]>4.0)
+#   aux=cat.gather(names,mask)   # concatenated masked columns (float32), one pass, no intermediate copy
+
+def file_hash(path,chunk=1<<22):
+    h=hashlib.sha256()
+    with open(path,"rb") as f:
+        for block in iter(lambda: f.read(chunk),b""):
+            h.update(block)
+    return h.hexdigest()
+
+def write_json(obj,path):
+    #atomic write (rename of a temporary file in the same directory)
+    fd,tmp=tempfile.mkstemp(dir=os.path.dirname(path),suffix=".tmp")
+    with os.fdopen(fd,"w") as f:
+        json.dump(obj,f)
+    os.replace(tmp,path)
+
+def stamped_hash(path,stampdir):
+    #sha256 of the CSV, recomputed only when (realpath, size, mtime_ns) changes
+    real=os.path.realpath(path)
+    st=os.stat(real)
+    stamp={"path":real,"size":st.st_size,"mtime_ns":st.st_mtime_ns}
+    fname=os.path.join(stampdir,hashlib.sha256(real.encode()).hexdigest()+".json")
+    try:
+        with open(fname) as f:
+            saved=json.load(f)
+        if all(saved.get(key) == stamp[key] for key in stamp):
+            return saved["sha256"]
+    except (OSError,ValueError,KeyError):
+        pass
+    stamp["sha256"]=file_hash(real)
+    os.makedirs(stampdir,exist_ok=True)
+    write_json(stamp,fname)
+    return stamp["sha256"]
+
+def read_chunks(path,comment,nchunk):
+    #yields the header, then lists of at most nchunk rows
+    with open(path,newline="") as f:
+        reader=csv.reader(line for line in f if not line.startswith(comment))
+        yield next(reader)
+        chunk=[]
+        for row in reader:
+            if len(row) > 0:
+                chunk.append(row)
+            if len(chunk) == nchunk:
+                yield chunk
+                chunk=[]
+        if len(chunk) > 0:
+            yield chunk
+
+def encode(col,table):
+    #float32 codes of a text column chunk, new categories are added to table (category -> code)
+    uniq,inv=np.unique(col,return_inverse=True)
+    ids=np.array([table.setdefault(u,len(table)) for u in uniq.tolist()],dtype=np.float32)
+    return ids[inv]
+
+def convert(path,outdir,comment="#",nchunk=1<<16):
+    #CSV -> <outdir>/<column index>.f32 and columns.json, nchunk rows at a time
+    chunks=read_chunks(path,comment,nchunk)
+    header=next(chunks)
+    os.makedirs(outdir,exist_ok=True)
+    fnames=[os.path.join(outdir,str(k)+".f32") for k in range(len(header))]
+    tables=[None]*len(header) # category -> code of the text columns
+    redo=[] # numeric in the first chunks but text later, converted again in a second pass
+    nrow=0
+    files=[open(fname,"wb") for fname in fnames]
+    try:
+        for chunk in chunks:
+            nrow=nrow+len(chunk)
+            for k,col in enumerate(zip(*chunk)):
+                if k in redo:
+                    continue
+                col=np.array(col,dtype=str)
+                if tables[k] is None:
+                    try:
+                        np.where(col=="","nan",col).astype(np.float32).tofile(files[k])
+                        continue
+                    except ValueError:
+                        if files[k].tell() > 0:
+                            redo.append(k)
+                            continue
+                        tables[k]={}
+                encode(col,tables[k]).tofile(files[k])
+    finally:
+        for f in files:
+            f.close()
+    if len(redo) > 0:
+        files={k:open(fnames[k],"wb") for k in redo}
+        try:
+            for k in redo:
+                tables[k]={}
+            chunks=read_chunks(path,comment,nchunk)
+            next(chunks)
+            for chunk in chunks:
+                cols=list(zip(*chunk))
+                for k in redo:
+                    encode(np.array(cols[k],dtype=str),tables[k]).tofile(files[k])
+        finally:
+            for f in files.values():
+                f.close()
+    columns={}
+    for k,name in enumerate(header):
+        categories=None
+        if tables[k] is not None:
+            #sorted categories (as np.unique of the whole column)
+            categories=sorted(tables[k])
+            rank=np.empty(len(categories),dtype=np.float32)
+            rank[[tables[k][c] for c in categories]]=np.arange(len(categories))
+            codes=np.fromfile(fnames[k],dtype=np.float32)
+            rank[codes.astype(np.int64)].tofile(fnames[k])
+        columns[name]={"file":str(k)+".f32","categories":categories}
+    write_json({"nrow":nrow,"columns":columns},os.path.join(outdir,"columns.json"))
+
+class Catalog(object):
+    def __init__(self,path,cachedir=None,comment="#"):
+        """columnar, memory-mapped view of a CSV catalog.
+
+        Args:
+           path: CSV file
+           cachedir: cache directory (default=kernelcache.default_cachedir())
+           comment: lines starting with comment are skipped
+        """
+        if cachedir is None:
+            cachedir=kernelcache.default_cachedir()
+        self.dir=os.path.join(cachedir,"catalog",stamped_hash(path,os.path.join(cachedir,"catalog","stamps")))
+        if not os.path.isfile(os.path.join(self.dir,"columns.json")):
+            convert(path,self.dir,comment)
+        with open(os.path.join(self.dir,"columns.json")) as f:
+            index=json.load(f)
+        self.nrow=index["nrow"]
+        self.columns=index["columns"]
+        self.mapped={}
+
+    def __getitem__(self,name):
+        #float32 column (read-only memmap), mapped on the first access
+        if name not in self.mapped:
+            fname=os.path.join(self.dir,self.columns[name]["file"])
+            self.mapped[name]=np.memmap(fname,dtype=np.float32,mode="r",shape=(self.nrow,)) if self.nrow > 0 else np.zeros(0,np.float32)
+        return self.mapped[name]
+
+    def equals(self,name,value):
+        #mask of a text column == value
+        categories=self.columns[name]["categories"]
+        if categories is None:
+            sys.exit("Error: equals needs a text column, "+str(name)+" is numeric (use within or the column values).")
+        if value not in categories:
+            return np.zeros(self.nrow,dtype=bool)
+        return self[name]==np.float32(categories.index(value))
+
+    def finite(self,names):
+        mask=np.ones(self.nrow,dtype=bool)
+        for name in names:
+            mask&=np.isfinite(self[name])
+        return mask
+
+    def within(self,name,vmin,vmax):
+        #mask of vmin < column < vmax
+        col=self[name]
+        return (col>vmin)&(col<vmax)
+
+    def gather(self,names,mask,out=None):
+        """masked columns concatenated into one float32 array (e.g. aux).
+
+        Args:
+           names: column names
+           mask: boolean mask of the rows
+           out: output array (len(names)*sum(mask)), allocated if None
+
+        Returns:
+           out
+        """
+        n=int(np.count_nonzero(mask))
+        if out is None:
+            out=np.empty(len(names)*n,dtype=np.float32)
+        for k,name in enumerate(names):
+            np.compress(mask,self[name],out=out[k*n:(k+1)*n])
+        return out
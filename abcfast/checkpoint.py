@@ -0,0 +1,108 @@
+import json
+import os
+import sys
+import tempfile
+import numpy as np
+
+#Checkpoint of ABCpmc (npz file).
+#
+#Saved: population x (and z), dist, ntry, weights w, cov, invcov, Qmat, the kernel covariance of the
+#last proposal (pcov), the alias tables, iteration, epsilon (and the history), the scale of abc.distance
+#and the discrepancies of the accepted particles (dcomp), and the RNG states
+#(numpy Generator of the numpy backend and the legacy np.random used by the resampling of the cuda backend).
+#The cuda backend reseeds curand with abc.seed at every generation, so the seed is enough for curand.
+#
+#A resumed run continues from the next generation, and the numpy backend gives bit-identical results
+#to the uninterrupted run.
+
+_arrays=["x","dist","ntry","w","invcov","Qmat","Ki","Li","Ui","z"]
+_optional=["cov","pcov","ess","epsilon","epsilon_list","nsim_total","dcomp","pscale","psd"]
+
+def save(abc,path):
+    data={}
+    for key in _arrays+_optional:
+        val=getattr(abc,key,None)
+        if val is not None and val is not False:
+            data[key]=np.asarray(val)
+    data["iteration"]=np.int64(abc.iteration)
+    data["seed"]=np.int64(abc.seed)
+    data["epsilon_history"]=np.asarray(abc.epsilon_history,dtype=np.float64)
+    data["config"]=np.asarray([abc.npart,abc.nwparam,int(abc.hyper)])
+    if abc.distance is not None and abc.distance.scale is not None:
+        data["dscale"]=np.asarray(abc.distance.scale)
+    if abc.rng is not None:
+        state={"bit_generator":type(abc.rng.bit_generator).__name__,"state":abc.rng.bit_generator.state}
+        data["rng"]=np.asarray(json.dumps(state))
+    legacy=np.random.get_state()
+    data["np_random_keys"]=legacy[1]
+    data["np_random_state"]=np.asarray([legacy[2],legacy[3],legacy[4]],dtype=np.float64)
+
+    #atomic write
+    dirname=os.path.dirname(os.path.abspath(path))
+    fd,tmp=tempfile.mkstemp(dir=dirname,suffix=".tmp")
+    with os.fdopen(fd,"wb") as f:
+        np.savez(f,**data)
+    os.replace(tmp,path)
+
+def load(abc,path):
+    data=np.load(path)
+    npart,nwparam,hyper=data["config"]
+    if npart != abc.npart or nwparam != abc.nwparam or bool(hyper) != abc.hyper:
+        print("checkpoint: npart,nwparam,hyper=",npart,nwparam,bool(hyper))
+        sys.exit("Error: the checkpoint does not match the setting of ABCpmc.")
+    if not abc.kernel_ready:
+        abc.setup_kernel()
+
+    for key in ["x","dist","ntry","z"]:
+        if key in data:
+            getattr(abc,key)[:]=data[key]
+    abc.w=data["w"]
+    abc.invcov=data["invcov"]
+    abc.Qmat=data["Qmat"]
+    abc.Ki,abc.Li,abc.Ui=data["Ki"],data["Li"],data["Ui"]
+    for key in _optional:
+        if key in data:
+            val=data[key]
+            setattr(abc,key,val[()] if val.ndim == 0 else val)
+    if "dscale" in data and abc.distance is not None:
+        abc.distance.scale=data["dscale"]
+    abc.iteration=int(data["iteration"])
+    abc.seed=int(data["seed"])
+    abc.epsilon_history=[float(eps) for eps in data["epsilon_history"]]
+    if "rng" in data:
+        state=json.loads(str(data["rng"]))
+        bitgen=getattr(np.random,state["bit_generator"])()
+        bitgen.state=state["state"]
+        abc.rng=np.random.Generator(bitgen)
+    pos,has_gauss,cached=data["np_random_state"]
+    np.random.set_state(("MT19937",data["np_random_keys"],int(pos),int(has_gauss),float(cached)))
+
+    if abc.onedim:
+        pass
+    elif abc.hyper:
+        abc.xw=np.copy(abc.x).reshape(abc.npart,abc.nhparam)
+        abc.zw=abc.z.reshape((abc.npart,abc.nsubject))
+    else:
+        abc.xw=np.copy(abc.x).reshape(abc.npart,abc.nparam)
+
+    if abc.backend == "cuda":
+        upload(abc)
+
+def upload(abc):
+    import pycuda.driver as cuda
+    cuda.memcpy_htod(abc.dev_x,abc.x)
+    if abc.hyper:
+        cuda.memcpy_htod(abc.dev_z,abc.z)
+    w=np.asarray(abc.w,dtype=np.float32)
+    abc.w,abc.dev_w=abc.setmem(abc.npart,np.float32)
+    abc.ww,abc.dev_ww=abc.setmem(abc.npart,np.float32)
+    abc.w[:]=w
+    cuda.memcpy_htod(abc.dev_w,abc.w)
+    cuda.memcpy_htod(abc.dev_invcov,abc.invcov)
+    cuda.memcpy_htod(abc.dev_Qmat,abc.Qmat)
+    abc.dev_Ki=cuda.mem_alloc(abc.Ki.nbytes)
+    abc.dev_Li=cuda.mem_alloc(abc.Li.nbytes)
+    abc.dev_Ui=cuda.mem_alloc(abc.Ui.nbytes)
+    cuda.memcpy_htod(abc.dev_Ki,abc.Ki)
+    cuda.memcpy_htod(abc.dev_Li,abc.Li)
+    cuda.memcpy_htod(abc.dev_Ui,abc.Ui)
@@ -1,8 +1,21 @@
-import pycuda.autoinit
-import pycuda.driver as cuda
-import pycuda.compiler
-from pycuda.compiler import SourceModule
+try:
+    import pycuda.autoinit
+    import pycuda.driver as cuda
+    import pycuda.compiler
+except ImportError:
+    #CPU only node. Use ABCpmc(backend="numpy")
+    cuda = None
 from abcfast.utils.statutils import *
+from abcfast import hostpmc
+from abcfast import hostpool
+from abcfast import hostweight
+from abcfast import kernelcache
+from abcfast import checkpoint
+from abcfast import metrics
+from abcfast import recovery
+from abcfast import resample
+from abcfast import transition
+from abcfast.random import mvn
 import sys
 
 #Note:
@@ -10,7 +23,7 @@ import sys
 #self.x, self.xx : sampled hyperparameters for the hierarchical mode
 #
 
-def gabcpmc_module (model,prior,nparam,ndata,nsample,nwparam,nreserved,footer,nhparam=None,nsubject=None,nss=None,hyperprior=None,maxtryx=10000000):
+def gabcpmc_source (model,prior,nparam,ndata,nsample,nwparam,nreserved,footer,nhparam=None,nsubject=None,nss=None,hyperprior=None,maxtryx=10000000):
     header=\
     "    #define WARP_SIZE 0x1f \n"\
     +"    #define NPARAM "+str(nparam)+"\n"\
@@ -50,13 +63,18 @@ def gabcpmc_module (model,prior,nparam,ndata,nsample,nwparam,nreserved,footer,nh
         +header
         
     if hyperprior is not None:
-        print(header+model+prior+hyperprior+footer)            
-        source_module = SourceModule(header+model+prior+hyperprior+footer,options=['-use_fast_math'],no_extern_c=True)
+        return header+model+prior+hyperprior+footer
     else:
-        print(header+model+prior+footer)
-        source_module = SourceModule(header+model+prior+footer,options=['-use_fast_math'],no_extern_c=True)
-        
-    return source_module
+        return header+model+prior+footer
+
+def gabcpmc_module (model,prior,nparam,ndata,nsample,nwparam,nreserved,footer,nhparam=None,nsubject=None,nss=None,hyperprior=None,maxtryx=10000000,builder=None,print_source=False):
+    #compiled only when the content hash is not found in the registry/on-disk cache (kernelcache.py)
+    source=gabcpmc_source(model,prior,nparam,ndata,nsample,nwparam,nreserved,footer,nhparam=nhparam,nsubject=nsubject,nss=nss,hyperprior=hyperprior,maxtryx=maxtryx)
+    if print_source:
+        print(source)
+    if builder is None:
+        builder=kernelcache.default_builder()
+    return builder.build(source,['-use_fast_math'])
 
 
 def setmem_device(npart,dtype):
@@ -68,9 +86,20 @@ def setmem_device(npart,dtype):
 
     
 class ABCpmc(object):
-    def __init__(self,hyper=False):
-            
+    def __init__(self,hyper=False,backend="cuda"):
+
+        self.backend = backend # "cuda" or "numpy" (host, vectorized python model/prior)
+        if backend not in ["cuda","numpy"]:
+            sys.exit("Error: backend should be cuda or numpy.")
+        if backend == "cuda" and cuda is None:
+            sys.exit("Error: pycuda is not available. Use backend=numpy.")
+
         self.maxtryx = 10000000 #MAXTRYX reduce this value when you debug the code.
+        self.nrecover = 0 # rounds relaunching the particles exceeding the try budget (recovery.py), 0=no recovery
+        self.recover_factor = 10 # try budget multiplied per recovery round
+        self.tryfactor = None # if set (with nrecover>0), try budget = tryfactor * tryquantile of the previous ntry (numpy backend)
+        self.tryquantile = 0.99
+        self.trybudget = None # try budget of the current generation
         self.nthread_use_max = 1024 #MAX NUMBER OF THREADS IN A BLOCK
         
         self._npart = 512  # number of the particles (default=512)
@@ -86,9 +115,39 @@ class ABCpmc(object):
         
         self.ess = None # Effective Sample Size
         self.Ecrit = 0.5 # critical ESS/npart for Resampling
+        self.resampling = "multinomial" # "multinomial", "systematic", "stratified" or "residual" (resample.py)
+        self.rindex = None # buffer of the resampled indices (npart)
+        self.rbuf = None # buffer of the resampled population, swapped with x
         
         self.wide=10.0
+        self.target_acceptance = None # if set, wide is replaced by pscale tuned toward this acceptance rate (transition.tune_scale)
+        self.tune_gain = 0.5 # step size of the tuning in log
+        self.pscale = None # per-dimension scale of the kernel covariance (nwparam), tuned after each generation
+        self.psd = None # marginal std of the population at the last tuning
+        self.transition = "global" # transition kernel, "global", "weighted", "olcm" or "knn" (transition.py, numpy backend)
+        self.knn = None # number of the neighbours of transition="knn" (None=max(2 nwparam+1,npart/4))
+        self.lkernel = None # (packed Cholesky factors, log det) of the per-particle kernels of the last proposal
+        self.blocks = None # block-wise moves: block size (random partition per generation) or list of the index lists (numpy backend)
+        self.block_jitter = 0.6 # relative kernel width outside the moved block (smaller: higher acceptance, more variable weights)
+        self.dblock = None # kick scale of the blocks (nblock,nwparam) of the last proposal
+        self.bounds = None # (nwparam,2) lower and upper bounds of the parameters, proposals outside are redrawn (numpy backend)
+        self.support = None # vectorized predicate support(x(n,nwparam)) -> bool(n), proposals outside are redrawn (numpy backend)
+        self.nsupport = 1024 # Monte Carlo samples for the mass of the kernels in the support
+        self.smass = None # mass of the kernel of each particle (and block) in the support (nblock,npart), of the last proposal
         self.epsilon_list = False
+        self.schedule = None # adaptive epsilon schedule (schedule.QuantileSchedule), used instead of epsilon_list
+        self.epsilon_history = [] # epsilon of each generation
+        self.checkpoint_path = None # if set, a checkpoint is written after each generation
+        self.history = None # history.History, if set, each generation is appended to the memory-mapped store
+        self.sinks = [] # metrics sinks (metrics.MemorySink, JSONLinesSink, PrometheusSink), a record per generation
+        self.timer = metrics.PhaseTimer() # wall time of the phases of the current generation
+        self.profiler = None # set by profiler.Profiler while profiling
+        self.distance = None # summary.Distance (normal mode), used instead of the default distance
+        self.dcomp = None # per-component discrepancies of the accepted particles (npart,ncomp) (numpy backend)
+        self.verbose = True # print ESS and resampling
+        self.resampled = False # resampled in the current generation
+        self.nsim = 0 # number of the simulations in the current generation
+        self.nsim_total = 0 # number of the simulations since the first generation
 #        self.nthread_use_max=512 # maximun number of the threads in a block for use
 
         self.x=None
@@ -121,8 +180,21 @@ class ABCpmc(object):
         self.dev_Ysm = None
 
         self.seed = -1
+        self.rng = None # numpy.random.Generator for the numpy backend
+        self.nbatch = 2**22 # max number of the samples simulated at once (numpy backend)
+        self.nprocess = 1 # number of worker processes (numpy backend)
+        self.pool = None # hostpool.HostPool when nprocess > 1
+        self.pcov = None # covariance of the transition kernel of the last proposal (numpy backend)
+        self.wblock = 512 # tile size of the weight computation (numpy backend)
+        self.wthread = None # number of threads of the weight computation (numpy backend, None=cpu_count)
+        self.wmode = "exact" # "exact" or "approx" (neighbours within wrcut kernel widths, numpy backend; faster only for a kernel narrow relative to the population, exact otherwise)
+        self.wrcut = 5.0 # truncation radius for wmode="approx" in units of the kernel width
+        self.wbound = None # bound of the relative dropped mass of the denominator for wmode="approx"
         self.onedim=False #when nparam or hnparam(when hyper) is 1, be True by update_kernel
         self.prepare = False
+        self.kernel_ready = False # kernel built and memory allocated (by the first run)
+        self.builder = None # kernelcache.KernelBuilder (None=kernelcache.default_builder())
+        self.print_source = False # print the generated cuda source when built
 
         if hyper:
             #use hyperprior (Hierarchical Bayes)
@@ -144,8 +216,37 @@ class ABCpmc(object):
 
 
     #resampling
-    def xres(self):        
-        return np.random.choice(self.x,self._npart,p=self.w)
+    def xres(self,out=None):
+        """resampled population with ABCpmc.resampling (np.random).
+
+        Args:
+           out: output array, (npart) for nwparam=1 or (npart,nwparam), allocated if None
+
+        Returns:
+           out
+        """
+        index=resample.resample(self.w,self._npart,self.resampling,np.random,out=self.rindex)
+        nwparam=len(self.x)//self._npart
+        xw=np.reshape(self.x,(self._npart,nwparam))
+        if out is None:
+            out=np.empty((self._npart,nwparam) if nwparam > 1 else self._npart,dtype=self.x.dtype)
+        np.take(xw,index,axis=0,out=np.reshape(out,(self._npart,nwparam)))
+        return out
+
+    def resample_population(self):
+        #x <- x[index] with ABCpmc.resampling, via the preallocated buffers (x and rbuf are swapped)
+        #the numpy backend uses its own generator (for the bit-exact resume)
+        if self.resampling not in resample.methods:
+            sys.exit("Error: resampling should be one of "+str(resample.methods)+".")
+        rng=self.rng if self.backend == "numpy" else np.random
+        if self.rindex is None or len(self.rindex) != self._npart:
+            self.rindex=np.empty(self._npart,dtype=np.int64)
+        if self.rbuf is None or self.rbuf.shape != self.x.shape or self.rbuf.dtype != self.x.dtype:
+            self.rbuf=np.empty_like(self.x)
+        index=resample.resample(self.w,self._npart,self.resampling,rng,out=self.rindex)
+        nwparam=len(self.x)//self._npart
+        np.take(np.reshape(self.x,(self._npart,nwparam)),index,axis=0,out=np.reshape(self.rbuf,(self._npart,nwparam)))
+        self.x, self.rbuf = self.rbuf, self.x
 
             
     @property
@@ -182,7 +283,7 @@ class ABCpmc(object):
 
     @npart.setter
     def npart(self,npart):
-        if checkpower2(npart):
+        if self.backend == "cuda" and checkpower2(npart):
             print("npart(icles)=",npart)
             sys.exit("Error: Use power of 2 as npart (# of the particles).")
         self._npart = npart
@@ -245,7 +346,16 @@ class ABCpmc(object):
         self._nsubject = nsubject
         self.update_kernel()
         
+    def setmem(self,npart,dtype):
+        if self.backend == "numpy":
+            x=np.ones(npart)
+            return x.astype(dtype),None
+        return setmem_device(npart,dtype)
+
     def update_kernel(self):        
+        #the kernel is built (and the memory allocated) at the first run(), see setup_kernel
+        self.close_pool()
+        self.kernel_ready = False
         if self.hyper:            
             self.update_hyper_kernel()
         else:
@@ -258,34 +368,8 @@ class ABCpmc(object):
            and self._prior is not None and self._npart is not None \
            and self._nparam is not None and self._ndata is not None \
            and self._nsample is not None:
-            footer=\
-    """
-    #include "abcpmc_init.h"
-    #include "abcpmc.h"
-    #include "compute_weight.h"
-    """
             self.nwparam = self._nparam
-            if self.aux is None:
-                self.aux,self.dev_aux=setmem_device(1,np.float32)
-            else:
-                self.aux=self.aux.astype(np.float32)
-                self.dev_aux = cuda.mem_alloc(self.aux.nbytes)        
-                cuda.memcpy_htod(self.dev_aux,self.aux)
-
             self.nreserved = self._nsample*self._ndata+self._nparam
-                
-            self.source_module=gabcpmc_module(self._model,self._prior,self._nparam,self._ndata,self._nsample,self.nwparam,self.nreserved,footer,maxtryx=self.maxtryx)
-            
-            self.pkernel_init=self.source_module.get_function("abcpmc_init")
-            self.pkernel=self.source_module.get_function("abcpmc")
-            self.wkernel=self.source_module.get_function("compute_weight")
-            
-            self.x,self.dev_x=setmem_device(self._npart*self._nparam,np.float32)
-            self.xx,self.dev_xx=setmem_device(self._npart*self._nparam,np.float32)
-            self.ntry,self.dev_ntry=setmem_device(self._npart,np.int32)
-            self.dist,self.dev_dist=setmem_device(self._npart,np.float32)
-            self.invcov,self.dev_invcov=setmem_device(self._nparam*self._nparam,np.float32)
-            self.Qmat,self.dev_Qmat=setmem_device(self._nparam*self._nparam,np.float32)
             self.nthread = min(self.nthread_use_max,self._nsample)
             self.prepare = True
 
@@ -302,13 +386,6 @@ class ABCpmc(object):
            and self._nsample is not None and self._nhparam is not None \
            and self._nsubject is not None:
 
-            footer=\
-"""
-    #include "habcpmc_init.h"
-    #include "habcpmc.h"
-    #include "compute_weight.h"
-"""            
-            
             nss=int(self._nsample/self._nsubject)
             if(self._nsample/self._nsubject - nss > 0.0):
                 print("nsubject=",self._nsubject,"nsample=",self._nsample)
@@ -316,30 +393,81 @@ class ABCpmc(object):
             self.nss = nss
             self.nwparam = self._nhparam
             self.nreserved = self._nsample*self._ndata+self._nhparam+self.nsubject*self._nparam
+            self.nthread = min(self.nthread_use_max,self._nsample)
+            self.prepare = True
+
+            if self._nhparam == 1:
+                self.onedim=True
+
+    def setup_kernel(self):
+        if self.hyper:
+            self.setup_hyper_kernel()
+        else:
+            self.setup_normal_kernel()
+        self.kernel_ready = True
+            
+    def setup_normal_kernel(self):
+        footer=\
+    """
+    #include "abcpmc_init.h"
+    #include "abcpmc.h"
+    #include "compute_weight.h"
+    """
+        if self.backend == "cuda":
+            if self.aux is None:
+                self.aux,self.dev_aux=setmem_device(1,np.float32)
+            else:
+                self.aux=np.ascontiguousarray(self.aux,dtype=np.float32)
+                self.dev_aux = cuda.mem_alloc(self.aux.nbytes)        
+                cuda.memcpy_htod(self.dev_aux,self.aux)
 
+            model=self._model
+            if self.distance is not None:
+                if self.distance.scale is None:
+                    sys.exit("Error: the cuda backend needs a fixed scale of the distance (array).")
+                model=self.distance.kernel_source()+model
+            self.source_module=gabcpmc_module(model,self._prior,self._nparam,self._ndata,self._nsample,self.nwparam,self.nreserved,footer,maxtryx=self.maxtryx,builder=self.builder,print_source=self.print_source)
+            if self.distance is not None:
+                dev_dscale,nbytes=self.source_module.get_global("dscale")
+                cuda.memcpy_htod(dev_dscale,np.ascontiguousarray(self.distance.scale,dtype=np.float32))
+            
+            self.pkernel_init=self.source_module.get_function("abcpmc_init")
+            self.pkernel=self.source_module.get_function("abcpmc")
+            self.wkernel=self.source_module.get_function("compute_weight")
+            
+        self.x,self.dev_x=self.setmem(self._npart*self._nparam,np.float32)
+        self.xx,self.dev_xx=self.setmem(self._npart*self._nparam,np.float32)
+        self.ntry,self.dev_ntry=self.setmem(self._npart,np.int32)
+        self.dist,self.dev_dist=self.setmem(self._npart,np.float32)
+        self.invcov,self.dev_invcov=self.setmem(self._nparam*self._nparam,np.float32)
+        self.Qmat,self.dev_Qmat=self.setmem(self._nparam*self._nparam,np.float32)
 
+    def setup_hyper_kernel(self):
+        footer=\
+"""
+    #include "habcpmc_init.h"
+    #include "habcpmc.h"
+    #include "compute_weight.h"
+"""            
+        if self.backend == "cuda":
+            if self.distance is not None:
+                sys.exit("Error: distance is available for the normal mode only.")
             self.source_module=gabcpmc_module(self._model,self._prior,self._nparam,self._ndata,self._nsample,\
                                               self.nwparam,self.nreserved,footer,nhparam=self._nhparam, nsubject=self._nsubject,\
-                                              nss=self.nss,hyperprior=self.hyperprior, maxtryx=self.maxtryx)
+                                              nss=self.nss,hyperprior=self.hyperprior, maxtryx=self.maxtryx,\
+                                              builder=self.builder,print_source=self.print_source)
             self.pkernel_init=self.source_module.get_function("habcpmc_init")
             self.pkernel=self.source_module.get_function("habcpmc")
             self.wkernel=self.source_module.get_function("compute_weight")
             
-            self.x,self.dev_x=setmem_device(self._npart*self._nhparam,np.float32)
-            self.xx,self.dev_xx=setmem_device(self._npart*self._nhparam,np.float32)
-            self.z,self.dev_z=setmem_device(self._npart*self._nparam*self.nsubject,np.float32)
-
-            self.ntry,self.dev_ntry=setmem_device(self._npart,np.int32)
-            self.dist,self.dev_dist=setmem_device(self._npart,np.float32)
-            self.invcov,self.dev_invcov=setmem_device(self._nhparam*self._nhparam,np.float32)
-            self.Qmat,self.dev_Qmat=setmem_device(self._nhparam*self._nhparam,np.float32)
-            self.nthread = min(self.nthread_use_max,self._nsample)
-            self.prepare = True
-
-            if self._nhparam == 1:
-                self.onedim=True
-                
+        self.x,self.dev_x=self.setmem(self._npart*self._nhparam,np.float32)
+        self.xx,self.dev_xx=self.setmem(self._npart*self._nhparam,np.float32)
+        self.z,self.dev_z=self.setmem(self._npart*self._nparam*self.nsubject,np.float32)
 
+        self.ntry,self.dev_ntry=self.setmem(self._npart,np.int32)
+        self.dist,self.dev_dist=self.setmem(self._npart,np.float32)
+        self.invcov,self.dev_invcov=self.setmem(self._nhparam*self._nhparam,np.float32)
+        self.Qmat,self.dev_Qmat=self.setmem(self._nhparam*self._nhparam,np.float32)
                 
     @property
     def Ysm(self):
@@ -348,36 +476,88 @@ class ABCpmc(object):
     @Ysm.setter
     def Ysm(self,Ysm):
         self._Ysm = Ysm.astype(np.float32)
-        self.dev_Ysm = cuda.mem_alloc(self._Ysm.nbytes)        
-        cuda.memcpy_htod(self.dev_Ysm,self._Ysm)
+        if self.backend == "cuda":
+            self.dev_Ysm = cuda.mem_alloc(self._Ysm.nbytes)        
+            cuda.memcpy_htod(self.dev_Ysm,self._Ysm)
         #        self.nsm = len(self._Ysm)
 
         
 
 
     def run(self):
+        if not self.kernel_ready:
+            self.setup_kernel()
+        self.timer.reset()
+        self.resampled = False
+        if self.backend == "numpy":
+            self.run_host()
+        else:
+            self.run_cuda()
+        if self.profiler is not None:
+            self.profiler.generation(self)
+        if self.iteration == 1:
+            self.nsim_total = 0
+        self.nsim_total = self.nsim_total + self.nsim
+        if self.sinks:
+            rec=metrics.record(self)
+            for sink in self.sinks:
+                sink.emit(rec)
+        if self.history is not None:
+            self.history.append(self)
+        if self.checkpoint_path is not None:
+            self.save_checkpoint(self.checkpoint_path)
+
+    def run_cuda(self):
+        if self.transition != "global":
+            sys.exit("Error: transition="+str(self.transition)+" is available for the numpy backend only.")
+        if self.bounds is not None or self.support is not None:
+            sys.exit("Error: bounds and support are available for the numpy backend only.")
+        if self.blocks is not None:
+            sys.exit("Error: blocks is available for the numpy backend only.")
         if self.hyper:
             sharedsize=(self.nreserved+self.ntcommon)*4 #byte
-            self.epsilon=self.epsilon_list[self.iteration]
+            self.epsilon=self.next_epsilon()
 
             if self.iteration == 0:                
-                self.pkernel_init(self.dev_x,self.dev_Ysm,np.float32(self.epsilon),np.int32(self.seed),self.dev_dist,self.dev_ntry,block=(int(self.nthread),1,1), grid=(int(self._npart),1),shared=sharedsize)
+                def launch(seed,dev_slot=np.intp(0),nslot=self._npart,maxtry=self.maxtryx):
+                    self.pkernel_init(self.dev_x,self.dev_Ysm,np.float32(self.epsilon),np.int32(seed),self.dev_dist,self.dev_ntry,dev_slot,np.int32(maxtry),block=(int(self.nthread),1,1), grid=(int(nslot),1),shared=sharedsize)
+                with self.timer("simulation"):
+                    launch(self.seed)
+                    cuda.Context.synchronize()
                 
-                cuda.memcpy_dtoh(self.x, self.dev_x)
+                with self.timer("transfer"):
+                    cuda.memcpy_dtoh(self.x, self.dev_x)
+                    cuda.memcpy_dtoh(self.dist, self.dev_dist)
+                    cuda.memcpy_dtoh(self.ntry, self.dev_ntry)
+                if self.nrecover > 0:
+                    self.recover_cuda(launch,self.dev_x)
+                self.nsim=int(np.sum(self.ntry))
 
                 #update covariance
-                self.update_invcov()
+                with self.timer("covariance"):
+                    self.update_invcov()
                 #update weight
                 self.init_weight()
                 self.iteration = 1
             else:
                 
-                self.pkernel(self.dev_xx,self.dev_x,self.dev_z,self.dev_Ysm,np.float32(self.epsilon),self.dev_Ki,self.dev_Li,self.dev_Ui,self.dev_Qmat,np.int32(self.seed),self.dev_dist,self.dev_ntry,block=(int(self.nthread),1,1), grid=(int(self._npart),1),shared=sharedsize)
+                def launch(seed,dev_slot=np.intp(0),nslot=self._npart,maxtry=self.maxtryx):
+                    self.pkernel(self.dev_xx,self.dev_x,self.dev_z,self.dev_Ysm,np.float32(self.epsilon),self.dev_Ki,self.dev_Li,self.dev_Ui,self.dev_Qmat,np.int32(seed),self.dev_dist,self.dev_ntry,dev_slot,np.int32(self._npart),np.int32(maxtry),block=(int(self.nthread),1,1), grid=(int(nslot),1),shared=sharedsize)
+                with self.timer("simulation"):
+                    launch(self.seed)
+                    cuda.Context.synchronize()
 
-                cuda.memcpy_dtoh(self.x, self.dev_xx)
-                cuda.memcpy_dtoh(self.z, self.dev_z)
+                with self.timer("transfer"):
+                    cuda.memcpy_dtoh(self.x, self.dev_xx)
+                    cuda.memcpy_dtoh(self.z, self.dev_z)
+                    cuda.memcpy_dtoh(self.dist, self.dev_dist)
+                    cuda.memcpy_dtoh(self.ntry, self.dev_ntry)
+                if self.nrecover > 0:
+                    self.recover_cuda(launch,self.dev_xx)
+                self.nsim=int(np.sum(self.ntry))
                 #update covariance
-                self.update_invcov()                
+                with self.timer("covariance"):
+                    self.update_invcov()                
                 #update weight
                 self.update_weight()
                 #swap
@@ -387,30 +567,50 @@ class ABCpmc(object):
                 
         else:
             sharedsize=(self.nreserved+self.ntcommon)*4 #byte
-            self.epsilon=self.epsilon_list[self.iteration]
+            self.epsilon=self.next_epsilon()
 
             if self.iteration == 0:
 
-                self.pkernel_init(self.dev_x,self.dev_Ysm,np.float32(self.epsilon),np.int32(self.seed),self.dev_dist,self.dev_ntry,self.dev_aux,block=(int(self.nthread),1,1), grid=(int(self._npart),1),shared=sharedsize)
+                def launch(seed,dev_slot=np.intp(0),nslot=self._npart,maxtry=self.maxtryx):
+                    self.pkernel_init(self.dev_x,self.dev_Ysm,np.float32(self.epsilon),np.int32(seed),self.dev_dist,self.dev_ntry,self.dev_aux,dev_slot,np.int32(maxtry),block=(int(self.nthread),1,1), grid=(int(nslot),1),shared=sharedsize)
+                with self.timer("simulation"):
+                    launch(self.seed)
+                    cuda.Context.synchronize()
                 
-                cuda.memcpy_dtoh(self.x, self.dev_x)
-                cuda.memcpy_dtoh(self.dist, self.dev_dist)
-                cuda.memcpy_dtoh(self.ntry, self.dev_ntry)
+                with self.timer("transfer"):
+                    cuda.memcpy_dtoh(self.x, self.dev_x)
+                    cuda.memcpy_dtoh(self.dist, self.dev_dist)
+                    cuda.memcpy_dtoh(self.ntry, self.dev_ntry)
+                if self.nrecover > 0:
+                    self.recover_cuda(launch,self.dev_x)
+                self.nsim=int(np.sum(self.ntry))
 
                 #update covariance
-                self.update_invcov()
+                with self.timer("covariance"):
+                    self.update_invcov()
                 #update weight
                 self.init_weight()
                 self.iteration = 1
                 
             else:
                 
-                self.pkernel(self.dev_xx,self.dev_x,self.dev_Ysm,np.float32(self.epsilon),self.dev_Ki,self.dev_Li,self.dev_Ui,self.dev_Qmat,np.int32(self.seed),self.dev_dist,self.dev_ntry,self.dev_aux,block=(int(self.nthread),1,1), grid=(int(self._npart),1),shared=sharedsize)
+                def launch(seed,dev_slot=np.intp(0),nslot=self._npart,maxtry=self.maxtryx):
+                    self.pkernel(self.dev_xx,self.dev_x,self.dev_Ysm,np.float32(self.epsilon),self.dev_Ki,self.dev_Li,self.dev_Ui,self.dev_Qmat,np.int32(seed),self.dev_dist,self.dev_ntry,self.dev_aux,dev_slot,np.int32(self._npart),np.int32(maxtry),block=(int(self.nthread),1,1), grid=(int(nslot),1),shared=sharedsize)
+                with self.timer("simulation"):
+                    launch(self.seed)
+                    cuda.Context.synchronize()
                 
-                cuda.memcpy_dtoh(self.x, self.dev_xx)
+                with self.timer("transfer"):
+                    cuda.memcpy_dtoh(self.x, self.dev_xx)
+                    cuda.memcpy_dtoh(self.dist, self.dev_dist)
+                    cuda.memcpy_dtoh(self.ntry, self.dev_ntry)
+                if self.nrecover > 0:
+                    self.recover_cuda(launch,self.dev_xx)
+                self.nsim=int(np.sum(self.ntry))
                 
                 #update covariance
-                self.update_invcov()
+                with self.timer("covariance"):
+                    self.update_invcov()
                 #update weight
                 self.update_weight()
                 #swap
@@ -418,33 +618,345 @@ class ABCpmc(object):
                 self.dev_w, self.dev_ww = self.dev_ww, self.dev_w
                 self.iteration = self.iteration + 1
             
+    def run_host(self):
+        #numpy backend of run(). model, prior (and hyperprior) are vectorized python functions (see hostpmc.py).
+        self.init_rng()
+        adaptive = self.distance is not None and self.distance.adaptive
+        if adaptive and self.iteration == 0:
+            #initial scale from the prior predictive (by the pilot of the schedule if any)
+            self.distance.scale=None
+            self.distance.reset()
+            if self.schedule is None:
+                self.pilot()
+        self.epsilon=self.next_epsilon()
+        if self.iteration > 0:
+            self.update_transition()
+            self.update_support()
+
+        #new population is written in xx, then swapped (x:new, xx:previous)
+        xnew=np.reshape(self.xx,(self._npart,self.nwparam))
+        if self.hyper:
+            z=np.reshape(self.z,(self._npart,self._nsubject*self._nparam))
+        elif self.distance is not None:
+            if self.dcomp is None or self.dcomp.shape != (self._npart,self.distance.ncomp):
+                self.dcomp=np.zeros((self._npart,self.distance.ncomp))
+            z=self.dcomp
+        else:
+            z=None
+        self.trybudget=self.try_budget()
+        if self.nprocess > 1:
+            self.nsim=self.sample_pool(xnew,z)
+        else:
+            with self.timer("simulation"):
+                self.nsim=self.sample_host(xnew,z)
+        if self.nrecover > 0:
+            with self.timer("simulation"):
+                self.nsim=self.nsim+self.recover_host(xnew,z)
+        if adaptive:
+            #new scale from the simulations of this generation, dist in the new units
+            self.distance.update_scale()
+            self.dist[:]=self.distance.rho(self.dcomp)
+        self.x, self.xx = self.xx, self.x
+        if self.iteration > 0:
+            self.pcov = self.cov
+        
+        #update covariance
+        with self.timer("covariance"):
+            self.update_invcov()
+        if self.iteration == 0:
+            self.init_weight()
+            self.iteration = 1
+        else:
+            self.update_weight()
+            self.iteration = self.iteration + 1
+
+    def update_transition(self):
+        #kernel of this generation from the weighted population (transition.py)
+        self.lkernel=None
+        self.dblock=None
+        if self.blocks is not None and self.nwparam > 1:
+            self.dblock=transition.block_scales(self.nwparam,self.blocks,self.block_jitter,self.rng)
+        if self.transition == "global":
+            return
+        if self.transition not in transition.methods:
+            sys.exit("Error: transition should be one of "+str(transition.methods)+".")
+        x=np.reshape(self.x,(self._npart,self.nwparam)).astype(np.float64)
+        with self.timer("covariance"):
+            if self.transition == "weighted":
+                cov,mu=transition.weighted_cov(x,self.w)
+                self.cov=transition.scale_cov(cov,self.kernel_wide())
+                L=transition.cholesky(self.cov[np.newaxis],1.e-9)[0]
+                self.Qmat=L.flatten().astype(np.float32)
+            else:
+                #olcm is not widened unless tuned
+                wide=1.0 if self.transition == "olcm" and self.target_acceptance is None else self.kernel_wide()
+                self.lkernel=transition.local_kernels(x,self.w,self.transition,wide=wide,dist=self.dist,\
+                                                      epsilon=self.epsilon,knn=self.knn)
+
+    def update_support(self):
+        #mass of the kernels in the support, for the weights (transition.support_mass)
+        self.smass=None
+        inside=transition.support_function(self.bounds,self.support)
+        if inside is None:
+            return
+        xprev=np.reshape(self.x,(self._npart,self.nwparam))
+        bounds=self.bounds if self.support is None else None
+        smass=[]
+        with self.timer("covariance"):
+            for D in [None] if self.dblock is None else self.dblock:
+                Qmat,Lpack=self.block_kernel(D)
+                smass.append(transition.support_mass(xprev,inside,Qmat,Lpack,bounds,self.nsupport,self.rng))
+        self.smass=np.array(smass)
+
+    def block_kernel(self,D):
+        #(Qmat, packed factors) of the kernel of the block with the kick scale D (None=whole)
+        Lpack=None if self.lkernel is None else self.lkernel[0]
+        if D is None:
+            return self.Qmat,Lpack
+        if Lpack is not None:
+            return None,transition.scale_factor(Lpack,D)
+        Q=np.reshape(np.asarray(self.Qmat,dtype=np.float64),(self.nwparam,self.nwparam))
+        return (D[:,np.newaxis]*Q).flatten(),None
+
+    def init_rng(self):
+        if self.rng is None:
+            self.rng = np.random.default_rng(None if self.seed < 0 else self.seed)
+
+    def host_functions(self,init):
+        #propose(n) and simulate(param) for hostpmc.rejection
+        model=self._model
+        if self.profiler is not None:
+            model=self.profiler.wrap_model(model)
+        if self.hyper:
+            if self.distance is not None:
+                sys.exit("Error: distance is available for the normal mode only.")
+            simulate=hostpmc.hsimulator(model,self._prior,self._Ysm,self._nsample,self._ndata,self._nparam,self._nsubject,self.rng,self.aux)
+            sampler=self._hyperprior
+        else:
+            simulate=hostpmc.simulator(model,self._Ysm,self._nsample,self._ndata,self.rng,self.aux,self.distance)
+            sampler=self._prior
+            
+        nwparam=self.nwparam
+        if init:
+            def propose(n):
+                return np.reshape(sampler(n,self.rng),(n,nwparam))
+        else:
+            xprev=np.reshape(self.x,(self._npart,nwparam))
+            Lpack=None if self.lkernel is None else self.lkernel[0]
+            inside=transition.support_function(self.bounds,self.support)
+            scratch=hostpmc.PerturbScratch(min(self._npart,max(1,int(self.nbatch/self._nsample))),nwparam,Lpack is not None)
+            def propose(n):
+                return hostpmc.perturb(xprev,self.Ki,self.Li,self.Ui,self.Qmat,n,self.rng,Lpack,inside,self.dblock,scratch=scratch)
+        if self.profiler is not None:
+            propose,simulate=self.profiler.wrap(propose,simulate)
+        return propose,simulate
+
+    def sample_host(self,xnew,z):
+        propose,simulate=self.host_functions(self.iteration == 0)
+        nbatch=max(1,int(self.nbatch/self._nsample))
+        return hostpmc.rejection(propose,simulate,np.arange(self._npart),xnew,self.dist,self.ntry,self.epsilon,self.trybudget,nbatch,z=z,verbose=self.nrecover == 0)
+
+    def try_budget(self):
+        #try budget of the first pass of this generation
+        if self.nrecover == 0 or self.tryfactor is None or self.iteration == 0:
+            return self.maxtryx
+        return recovery.try_budget(self.ntry,self.maxtryx,self.tryfactor,self.tryquantile)
+
+    def recover_host(self,xnew,z):
+        #relaunch only the failed slots with a larger budget (recovery.py)
+        propose,simulate=self.host_functions(self.iteration == 0)
+        nbatch=max(1,int(self.nbatch/self._nsample))
+        failed=recovery.failed_slots(xnew)
+        budget=self.trybudget
+        nsim=0
+        for iround in range(self.nrecover):
+            if len(failed) == 0:
+                break
+            budget=budget*self.recover_factor
+            if self.verbose:
+                print("Recovery #"+str(iround+1)+":",len(failed),"particles, try budget=",budget)
+            ntry0=self.ntry[failed].copy()
+            nsim=nsim+hostpmc.rejection(propose,simulate,failed,xnew,self.dist,self.ntry,self.epsilon,budget,nbatch,z=z,verbose=False)
+            self.ntry[failed]=self.ntry[failed]+ntry0
+            failed=recovery.failed_slots(xnew)
+        if len(failed) > 0:
+            self.raise_failed(xnew,failed,z)
+        return nsim
+
+    def recover_cuda(self,launch,dev_out):
+        #relaunch only the failed slots (a grid of len(failed) blocks) with a larger budget (recovery.py)
+        xnew=np.reshape(self.x,(self._npart,self.nwparam))
+        z=np.reshape(self.z,(self._npart,-1)) if self.hyper and self.iteration > 0 else None
+        failed=recovery.failed_slots(xnew)
+        budget=self.maxtryx
+        for iround in range(self.nrecover):
+            if len(failed) == 0:
+                break
+            budget=min(budget*self.recover_factor,np.iinfo(np.int32).max)
+            if self.verbose:
+                print("Recovery #"+str(iround+1)+":",len(failed),"particles, try budget=",budget)
+            ntry0=self.ntry[failed].copy()
+            with self.timer("transfer"):
+                dev_slot=cuda.to_device(failed.astype(np.int32))
+            with self.timer("simulation"):
+                launch(recovery.recovery_seed(self.seed,self.iteration,iround+1),dev_slot,len(failed),budget)
+                cuda.Context.synchronize()
+            #the kernel writes the failed slots only
+            with self.timer("transfer"):
+                cuda.memcpy_dtoh(self.x, dev_out)
+                cuda.memcpy_dtoh(self.dist, self.dev_dist)
+                cuda.memcpy_dtoh(self.ntry, self.dev_ntry)
+                if z is not None:
+                    cuda.memcpy_dtoh(self.z, self.dev_z)
+            dev_slot.free()
+            self.ntry[failed]=self.ntry[failed]+ntry0
+            failed=recovery.failed_slots(xnew)
+        if len(failed) > 0:
+            self.raise_failed(xnew,failed,z)
+
+    def raise_failed(self,xnew,failed,z):
+        raise recovery.MaxTryError("EXCEED MAXTRYX: "+str(len(failed))+" particles failed. Increase epsilon or MAXTRYX.",\
+                                   failed,np.copy(xnew),np.copy(self.dist),np.copy(self.ntry),\
+                                   None if z is None else np.copy(z),self.epsilon,self.iteration)
+
+    def sample_pool(self,xnew,z):
+        #particles are sharded over nprocess worker processes (hostpool.py)
+        if self.iteration == 0 or self.pool is None or not self.pool.matches(self):
+            #(re)start the pool with the current setting (model, Ysm, aux, bounds/support, distance...)
+            self.close_pool()
+            self.pool=hostpool.HostPool(self,self.nprocess)
+        with self.timer("simulation"):
+            verbose = self.nrecover == 0
+            dscale = None if self.distance is None else self.distance.scale
+            if self.iteration == 0:
+                nsim=self.pool.run(self.epsilon,self.rng,maxtryx=self.trybudget,verbose=verbose,dscale=dscale)
+            else:
+                Lpack=None if self.lkernel is None else self.lkernel[0]
+                nsim=self.pool.run(self.epsilon,self.rng,self.x,self.Ki,self.Li,self.Ui,self.Qmat,maxtryx=self.trybudget,verbose=verbose,dscale=dscale,Lpack=Lpack,dblock=self.dblock)
+            for D in self.pool.kept:
+                self.distance.add(D)
+        with self.timer("transfer"):
+            xnew[:]=self.pool.arr["xnew"]
+            self.dist[:]=self.pool.arr["dist"]
+            self.ntry[:]=self.pool.arr["ntry"]
+            if z is not None:
+                z[:]=self.pool.arr["z"]
+        return nsim
+
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    def next_epsilon(self):
+        if self.schedule is None:
+            epsilon=self.epsilon_list[self.iteration]
+        elif self.iteration == 0:
+            epsilon=self.schedule.initial(self.pilot())
+        else:
+            epsilon=self.schedule.next(self.dist,self.epsilon)
+        if self.iteration == 0:
+            self.epsilon_history=[]
+        self.epsilon_history.append(epsilon)
+        return epsilon
+
+    def pilot(self):
+        #distances of a pilot batch from the prior predictive (for schedule.initial)
+        #with an adaptive distance without a scale, the scale is estimated from the pilot first
+        if self.backend == "numpy":
+            self.init_rng()
+            npilot=self._npart if self.schedule is None or self.schedule.npilot is None else self.schedule.npilot
+            propose,simulate=self.host_functions(True)
+            nbatch=max(1,int(self.nbatch/self._nsample))
+            dist=[]
+            for i in range(0,npilot,nbatch):
+                rho,zs=simulate(propose(min(nbatch,npilot-i)))
+                dist.append(rho if zs is None or self.hyper else zs)
+            if self.distance is None or self.hyper:
+                return np.concatenate(dist)
+            if self.distance.scale is None:
+                self.distance.update_scale()
+            return self.distance.rho(np.concatenate(dist))
+
+        #initial sampler with epsilon=inf accepts the first try
+        #with a seed derived from self.seed, so the pilot is not the stream of the first generation
+        seed=int(np.random.SeedSequence([max(self.seed,0),2**31]).generate_state(1)[0]>>1)
+        sharedsize=(self.nreserved+self.ntcommon)*4 #byte
+        if self.hyper:
+            self.pkernel_init(self.dev_x,self.dev_Ysm,np.float32(np.inf),np.int32(seed),self.dev_dist,self.dev_ntry,np.intp(0),np.int32(self.maxtryx),block=(int(self.nthread),1,1), grid=(int(self._npart),1),shared=sharedsize)
+        else:
+            self.pkernel_init(self.dev_x,self.dev_Ysm,np.float32(np.inf),np.int32(seed),self.dev_dist,self.dev_ntry,self.dev_aux,np.intp(0),np.int32(self.maxtryx),block=(int(self.nthread),1,1), grid=(int(self._npart),1),shared=sharedsize)
+        cuda.memcpy_dtoh(self.dist, self.dev_dist)
+        return np.copy(self.dist)
+
+    def stop(self):
+        #True when the epsilon_list is exhausted or the schedule says stop
+        if self.schedule is None:
+            return self.iteration >= len(self.epsilon_list)
+        return self.schedule.stop(self.ntry,self.epsilon,self.iteration)
+
+    def save_checkpoint(self,path):
+        #see checkpoint.py
+        checkpoint.save(self,path)
+
+    def load_checkpoint(self,path):
+        #set model, prior, ... as in the saved run before loading
+        checkpoint.load(self,path)
+
     def check(self):
-        cuda.memcpy_dtoh(self.ntry, self.dev_ntry)
+        if self.backend == "cuda":
+            cuda.memcpy_dtoh(self.ntry, self.dev_ntry)
         FR=len(self.x[self.x!=self.x])/len(self.x)
         print("#"+str(self.iteration-1)+":","epsilon=",self.epsilon,"Fail Rate=",FR)
         if FR>0:
-            print("ERROR: Increase epsilon or MAXVALX in kernel.")
-            sys.exit("")
+            xw=np.reshape(self.x,(self._npart,self.nwparam))
+            raise recovery.MaxTryError("Fail Rate="+str(FR)+". Increase epsilon or MAXTRYX, or set nrecover.",\
+                                       recovery.failed_slots(xw),np.copy(xw),np.copy(self.dist),np.copy(self.ntry),\
+                                       np.copy(self.z) if self.hyper else None,self.epsilon,self.iteration-1)
         print("mean max min = ",np.mean(self.ntry),np.max(self.ntry),np.min(self.ntry))
 
     def init_weight(self):
         #window
-        self.w,self.dev_w=setmem_device(self._npart,np.float32)
-        self.ww,self.dev_ww=setmem_device(self._npart,np.float32)
+        self.w,self.dev_w=self.setmem(self._npart,np.float32)
+        self.ww,self.dev_ww=self.setmem(self._npart,np.float32)
         
-        Ki,Li,Ui=genalias_init(self.w)
-        self.dev_Ki = cuda.mem_alloc(Ki.nbytes)
-        self.dev_Li = cuda.mem_alloc(Li.nbytes)
-        self.dev_Ui = cuda.mem_alloc(Ui.nbytes)        
-        cuda.memcpy_htod(self.dev_Ki,Ki)
-        cuda.memcpy_htod(self.dev_Li,Li)
-        cuda.memcpy_htod(self.dev_Ui,Ui)
+        with self.timer("alias"):
+            Ki,Li,Ui=genalias_init(self.w)
+            self.Ki,self.Li,self.Ui=Ki,Li,Ui
+            if self.backend == "numpy":
+                return
+            self.dev_Ki = cuda.mem_alloc(Ki.nbytes)
+            self.dev_Li = cuda.mem_alloc(Li.nbytes)
+            self.dev_Ui = cuda.mem_alloc(Ui.nbytes)        
+            cuda.memcpy_htod(self.dev_Ki,Ki)
+            cuda.memcpy_htod(self.dev_Li,Li)
+            cuda.memcpy_htod(self.dev_Ui,Ui)
+
+    def kernel_wide(self):
+        #scale factor(s) of the kernel covariance, wide or the tuned pscale
+        if self.target_acceptance is None or self.pscale is None:
+            return self.wide
+        return self.pscale
+
+    def update_pscale(self):
+        #per-dimension scale tuned toward target_acceptance by the ntry of this generation (transition.tune_scale)
+        if self.target_acceptance is None:
+            return
+        sd=np.std(np.reshape(self.x,(self._npart,self.nwparam)),axis=0)
+        if self.iteration == 0 or self.pscale is None or self.psd is None:
+            self.pscale=np.full(self.nwparam,1.0 if self.transition == "olcm" else float(self.wide))
+        else:
+            acceptance=self._npart/float(np.sum(self.ntry))
+            self.pscale=transition.tune_scale(self.pscale,acceptance,self.target_acceptance,self.tune_gain,sd/self.psd)
+        self.psd=sd
 
     def update_invcov(self):
-                
+        self.update_pscale()
+        wide=self.kernel_wide()
+
         #inverse covariance matrix
         if self.onedim:
-            cov = self.wide*np.var(self.x)
+            cov = np.squeeze(transition.scale_cov(np.var(self.x),wide))
             self.cov = cov
             self.invcov = np.array(1.0/cov).astype(np.float32)
             self.Qmat = np.array([np.sqrt(cov)]).astype(np.float32)
@@ -452,69 +964,112 @@ class ABCpmc(object):
             if self.hyper:
                 self.zw=self.z.reshape((self._npart,self._nsubject))
                 self.xw=np.copy(self.x).reshape(self._npart,self._nhparam)
-                cov = self.wide*np.cov(self.xw.transpose(),bias=True)                
+                cov = transition.scale_cov(np.cov(self.xw.transpose(),bias=True),wide)
             else:
                 self.xw=np.copy(self.x).reshape(self._npart,self._nparam)
-                cov = self.wide*np.cov(self.xw.transpose(),bias=True)
+                cov = transition.scale_cov(np.cov(self.xw.transpose(),bias=True),wide)
             self.cov = cov 
             self.invcov = (np.linalg.inv(cov).flatten()).astype(np.float32)
             
-            # Q matrix for multivariate Gaussian prior sampler
-            [eigenvalues, eigenvectors] = np.linalg.eig(cov)
-            l = np.matrix(np.diag(np.sqrt(np.abs(eigenvalues))))
-            Q = np.matrix(eigenvectors) * l
-            self.Qmat=(Q.flatten()).astype(np.float32)
-                
-        cuda.memcpy_htod(self.dev_invcov,self.invcov)
-        cuda.memcpy_htod(self.dev_Qmat,self.Qmat)
+            # Q matrix (Q Q^T = cov) for multivariate Gaussian prior sampler, Cholesky factor (abcfast.random.mvn)
+            # cov is new in each generation, so it is not cached
+            self.Qmat=(mvn.factor(cov,cache=False).flatten()).astype(np.float32)
+
+        if self.backend == "cuda":
+            cuda.memcpy_htod(self.dev_invcov,self.invcov)
+            cuda.memcpy_htod(self.dev_Qmat,self.Qmat)
         
         
     def update_weight(self):
         #update weight
-        sharedsize=int(self._npart*4) #byte
-        
-        weight_nthread=min(self._npart,self.nthread_use_max)
-        self.wkernel(self.dev_ww, self.dev_w, self.dev_xx, self.dev_x, self.dev_invcov, block=(int(weight_nthread),1,1), grid=(int(self._npart),1),shared=sharedsize)
-        cuda.memcpy_dtoh(self.w, self.dev_ww)
-#        print("w=",self.w)
-        if self.hyper:
-            if self._nhparam == 1:
-                pri=self.fhprior(self.x)
+        with self.timer("weights"):
+            if self.backend == "numpy":
+                xnew=np.reshape(self.x,(self._npart,self.nwparam))
+                xprev=np.reshape(self.xx,(self._npart,self.nwparam))
+                logden=self.log_denominator(xnew,xprev)
+                invden=np.exp(np.min(logden)-logden)
             else:
-                pri=self.fhprior(self.xw)
-        else:
-            if self._nparam == 1:
-                pri=self.fprior(self.x)
+                sharedsize=int(self._npart*4) #byte
+        
+                weight_nthread=min(self._npart,self.nthread_use_max)
+                self.wkernel(self.dev_ww, self.dev_w, self.dev_xx, self.dev_x, self.dev_invcov, block=(int(weight_nthread),1,1), grid=(int(self._npart),1),shared=sharedsize)
+                cuda.memcpy_dtoh(self.w, self.dev_ww)
+                invden=1.0/self.w
+#            print("w=",self.w)
+            if self.hyper:
+                if self._nhparam == 1:
+                    pri=self.fhprior(self.x)
+                else:
+                    pri=self.fhprior(self.xw)
             else:
-                pri=self.fprior(self.xw)
-#        print("pri=",pri)
+                if self._nparam == 1:
+                    pri=self.fprior(self.x)
+                else:
+                    pri=self.fprior(self.xw)
+#            print("pri=",pri)
 
-        self.w=pri/self.w
-        self.w=self.w/np.sum(self.w)
-        self.ess=1.0/(np.linalg.norm(self.w)**2)
+            self.w=pri*invden
+            self.w=self.w/np.sum(self.w)
+            self.ess=1.0/(np.linalg.norm(self.w)**2)
 
-        print("ESS=",self.ess,"Npart=",self._npart)
-        if self.ess < self.Ecrit*self._npart:
-            print("Resampling.")
+            if self.verbose:
+                print("ESS=",self.ess,"Npart=",self._npart)
+            if self.ess < self.Ecrit*self._npart:
+                if self.verbose:
+                    print("Resampling.")
+                self.resampled = True
 
-            if len(self.x) == self._npart:
-                self.x=np.random.choice(self.x,self._npart,p=self.w)
-            else:
-                index=np.random.choice(len(self.w),self._npart,p=self.w)
-                self.x=self.xw[index,:].flatten()
-            self.w=np.ones(self._npart)
-            self.w=self.w/np.sum(self.w)
+                self.resample_population()
+                self.w=np.ones(self._npart)
+                self.w=self.w/np.sum(self.w)
             
-        self.w=self.w.astype(np.float32)
+            self.w=self.w.astype(np.float32)
+
+            #        plt.plot(self.xw[:,0],self.xw[:,1],".",label="#"+str(self.iteration))
 
-        #        plt.plot(self.xw[:,0],self.xw[:,1],".",label="#"+str(self.iteration))
 
+        with self.timer("alias"):
+            Ki,Li,Ui=genalias_init(self.w)
+            self.Ki,self.Li,self.Ui=Ki,Li,Ui
+            if self.backend == "cuda":
+                cuda.memcpy_htod(self.dev_Ki,Ki)
+                cuda.memcpy_htod(self.dev_Li,Li)
+                cuda.memcpy_htod(self.dev_Ui,Ui)
 
-        Ki,Li,Ui=genalias_init(self.w)
-        cuda.memcpy_htod(self.dev_Ki,Ki)
-        cuda.memcpy_htod(self.dev_Li,Li)
-        cuda.memcpy_htod(self.dev_Ui,Ui)
 
+    def log_denominator(self,xnew,xprev):
+        #log of the weight denominator with the kernel used in the proposal (hostweight.py),
+        #mixed over the blocks (dblock)
+        dblock=[None] if self.dblock is None else self.dblock
+        logden=[]
+        bounds=[]
+        for k,D in enumerate(dblock):
+            #kernels truncated to the support are renormalized by their mass in the support
+            wprev=self.w
+            if self.smass is not None:
+                wprev=np.where(self.smass[k] > 0.0,self.w/np.maximum(self.smass[k],1.e-300),0.0)
+            if self.lkernel is not None:
+                #per-particle kernels, always exact
+                Qmat,Lpack=self.block_kernel(D)
+                logdet=self.lkernel[1] if D is None else self.lkernel[1]+np.sum(np.log(D))
+                logden.append(hostweight.compute_logweight_local(xnew,xprev,wprev,Lpack,logdet,nblock=self.wblock,nthread=self.wthread))
+                continue
+            cov=self.pcov if D is None else transition.scale_cov(self.pcov,D**2)
+            if self.wmode == "approx":
+                ld,bound=hostweight.compute_logweight_approx(xnew,xprev,wprev,cov,rcut=self.wrcut,nblock=self.wblock,nthread=self.wthread)
+                bounds.append(np.max(bound))
+            else:
+                ld=hostweight.compute_logweight(xnew,xprev,wprev,cov,nblock=self.wblock,nthread=self.wthread)
+            logden.append(ld if D is None else ld-np.sum(np.log(D)))
+        if bounds:
+            self.wbound=max(bounds)
+            if self.verbose:
+                print("max relative dropped mass <",self.wbound)
+        if len(logden) == 1:
+            return logden[0]
+        logden=np.array(logden)
+        m=np.max(logden,axis=0)
+        return m+np.log(np.mean(np.exp(logden-m),axis=0))
 
     def check_preparation(self):
         if not self.prepare:
@@ -1,4 +1,7 @@
-from pycuda.compiler import SourceModule
+try:
+    from pycuda.compiler import SourceModule
+except ImportError:
+    SourceModule = None
 
 def gabcrm_module ():
     source_module = SourceModule("""
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import numpy as np
+
+#Append-only history of the ABC-PMC generations on memory-mapped files.
+#
+#path/
+#  index.json : number of the generations, capacity, shapes/dtypes, epsilon, ess, nsim per generation
+#  x.dat, w.dat, dist.dat, ntry.dat (, z.dat) : (capacity, npart, ...) arrays, one row per generation
+#  pscale.dat : (capacity, nwparam) tuned kernel scale of the next proposal (ABCpmc.target_acceptance)
+#
+#The data files are preallocated for maxgen generations and doubled when full. A generation is
+#written to its own row (abc.iteration-1), so appending again after a resume overwrites the same row.
+#The index is rewritten (atomically) after the data, so readers never see a partial generation.
+#Use load_history(path) to read the trajectory as read-only memmaps (no copy).
+
+_dtypes={"x":np.float32,"w":np.float32,"dist":np.float32,"ntry":np.int32,"z":np.float32,"pscale":np.float64}
+
+def _write_index(path,index):
+    fd,tmp=tempfile.mkstemp(dir=path,suffix=".tmp")
+    with os.fdopen(fd,"w") as f:
+        json.dump(index,f)
+    os.replace(tmp,os.path.join(path,"index.json"))
+
+def _read_index(path):
+    with open(os.path.join(path,"index.json")) as f:
+        return json.load(f)
+
+class History(object):
+    def __init__(self,path,maxgen=64):
+        """history store, set to ABCpmc.history.
+
+        Args:
+           path: directory of the store (existing store is appended)
+           maxgen: initial capacity in generations
+        """
+        self.path=path
+        self.maxgen=maxgen
+        self.arr={}
+        os.makedirs(path,exist_ok=True)
+        if os.path.isfile(os.path.join(path,"index.json")):
+            self.index=_read_index(path)
+            self.open_arrays()
+        else:
+            self.index=None
+
+    def create(self,fields):
+        self.index={"ngen":0,"maxgen":self.maxgen,"fields":fields,"epsilon":[],"ess":[],"nsim":[]}
+        for key in fields:
+            shape=[self.maxgen]+fields[key]
+            nbytes=int(np.prod(shape))*np.dtype(_dtypes[key]).itemsize
+            with open(os.path.join(self.path,key+".dat"),"wb") as f:
+                f.truncate(nbytes)
+        self.open_arrays()
+        _write_index(self.path,self.index)
+
+    def open_arrays(self):
+        for key in self.index["fields"]:
+            shape=tuple([self.index["maxgen"]]+self.index["fields"][key])
+            self.arr[key]=np.memmap(os.path.join(self.path,key+".dat"),dtype=_dtypes[key],mode="r+",shape=shape)
+
+    def grow(self,maxgen):
+        for key in self.index["fields"]:
+            self.arr[key].flush()
+            del self.arr[key]
+            shape=[maxgen]+self.index["fields"][key]
+            nbytes=int(np.prod(shape))*np.dtype(_dtypes[key]).itemsize
+            with open(os.path.join(self.path,key+".dat"),"r+b") as f:
+                f.truncate(nbytes)
+        self.index["maxgen"]=maxgen
+        self.open_arrays()
+
+    def append(self,abc):
+        #store the current generation of abc
+        npart=abc.npart
+        fields={"x":[npart,abc.nwparam],"w":[npart],"dist":[npart],"ntry":[npart]}
+        if abc.hyper:
+            fields["z"]=[npart,abc.nsubject*abc.nparam]
+        if abc.pscale is not None:
+            fields["pscale"]=[abc.nwparam]
+        if self.index is None:
+            self.create(fields)
+
+        igen=abc.iteration-1
+        if igen >= self.index["maxgen"]:
+            self.grow(max(2*self.index["maxgen"],igen+1))
+        self.arr["x"][igen]=np.reshape(abc.x,(npart,abc.nwparam))
+        self.arr["w"][igen]=abc.w
+        self.arr["dist"][igen]=abc.dist
+        self.arr["ntry"][igen]=abc.ntry
+        if abc.hyper:
+            self.arr["z"][igen]=np.reshape(abc.z,(npart,-1))
+        if "pscale" in self.arr and abc.pscale is not None:
+            self.arr["pscale"][igen]=abc.pscale
+        for key in self.arr:
+            self.arr[key].flush()
+
+        for key,val in [("epsilon",abc.epsilon),("ess",abc.ess),("nsim",getattr(abc,"nsim",None))]:
+            del self.index[key][igen:]
+            self.index[key].append(None if val is None else float(val))
+        self.index["ngen"]=igen+1
+        _write_index(self.path,self.index)
+
+def load_history(path):
+    """read the history without copy.
+
+    Returns:
+       dict of read-only memmaps (ngen, npart, ...) for x, w, dist, ntry (and z, pscale),
+       and lists for epsilon, ess and nsim
+    """
+    index=_read_index(path)
+    ngen=index["ngen"]
+    hist={}
+    for key in index["fields"]:
+        shape=tuple([index["maxgen"]]+index["fields"][key])
+        hist[key]=np.memmap(os.path.join(path,key+".dat"),dtype=_dtypes[key],mode="r",shape=shape)[:ngen]
+    for key in ["epsilon","ess","nsim"]:
+        hist[key]=index[key]
+    return hist
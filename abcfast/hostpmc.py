@@ -0,0 +1,177 @@
+import numpy as np
+from abcfast import transition
+from abcfast.random.alias import aliasgen
+from abcfast.random import mvn
+
+#Host (numpy) counterparts of the ABC-PMC kernels.
+#
+#A CUDA block (=one particle) of abcpmc_init.h/abcpmc.h retries until rho < epsilon.
+#Here all the pending particles are advanced together by whole-array operations:
+#each round gives every pending particle m tries (m is set from the running acceptance rate)
+#and a particle takes its first accepted try, so ntry has the same meaning as in the kernels.
+#
+#vectorized python model/prior for the host backend:
+# normal mode:
+#   param(n,NPARAM) = prior(n, rng)
+#   Ysim(n,NSAMPLE,NDATA) = model(param(n,NPARAM), NSAMPLE, rng, aux)
+# hierarchical mode:
+#   hparam(n,NHPARAM) = hyperprior(n, rng)
+#   param(n,NSUBJECT,NPARAM) = prior(hparam(n,NHPARAM), NSUBJECT, rng)
+#   Ysim(n,NSUBJECT,NSS,NDATA) = model(param(n,NSUBJECT,NPARAM), NSS, rng, aux)
+
+class PerturbScratch(object):
+    def __init__(self,n,nwparam,local=False):
+        """buffers of perturb (kick, standard normals, per-particle factors), allocated once per run.
+
+        Args:
+           n: number of the proposals of a batch (grown if a larger batch comes)
+           nwparam: dimension of the parameters
+           local: allocate the buffers of the per-particle kernels (Lpack)
+        """
+        self.nwparam=nwparam
+        self.local=local
+        self.il=np.tril_indices(nwparam)
+        self.n=0
+        self.grow(n)
+
+    def grow(self,n):
+        d=self.nwparam
+        self.n=n
+        self.out=np.empty((n,d))
+        self.z=np.empty((n,d))
+        if self.local:
+            self.pack=np.empty((n,d*(d+1)//2))
+            self.L=np.zeros((n,d,d)) # upper triangle stays zero
+
+    def get(self,n):
+        #views of the first n rows: out, z, L (None without local)
+        if n > self.n:
+            self.grow(max(n,2*self.n))
+        return self.out[:n],self.z[:n],self.L[:n] if self.local else None
+
+def perturb(xprev,Ki,Li,Ui,Qmat,n,rng,Lpack=None,inside=None,dblock=None,maxredraw=1000,scratch=None):
+    #param = xprev[isel] + Qmat*rn as in abcpmc.h
+    #or xprev[isel] + L_isel*rn with the per-particle kernels (packed Cholesky factors, transition.py)
+    #with dblock (transition.block_scales), the kick is scaled by dblock[bsel] of a random block bsel
+    #with inside (transition.support_function), rn of the out-of-support params is redrawn (same isel, bsel),
+    #ValueError if some are still outside after maxredraw redraws (nothing outside the support is simulated)
+    #scratch (PerturbScratch) holds the buffers of the kick across the calls of a run
+    nwparam=xprev.shape[1]
+    if scratch is None:
+        scratch=PerturbScratch(n,nwparam,Lpack is not None)
+    isel=aliasgen(Ki,Li,Ui,n,rng)
+    bsel=None if dblock is None else rng.integers(len(dblock),size=n)
+    Q=None if Lpack is not None else np.reshape(np.asarray(Qmat),(nwparam,nwparam))
+    def kick(isel,bsel):
+        out,z,L=scratch.get(len(isel))
+        if Lpack is not None:
+            pack=scratch.pack[:len(isel)]
+            np.take(Lpack,isel,axis=0,out=pack)
+            L[:,scratch.il[0],scratch.il[1]]=pack
+        else:
+            L=Q
+        dx=mvn.mvnf(0.0,None,rng,out=out,z=z,L=L)
+        if bsel is not None:
+            dx*=dblock[bsel]
+        return dx
+    param=xprev[isel]+kick(isel,bsel)
+    if inside is not None:
+        redo=np.nonzero(~inside(param))[0]
+        for i in range(maxredraw):
+            if len(redo) == 0:
+                break
+            param[redo]=xprev[isel[redo]]+kick(isel[redo],None if bsel is None else bsel[redo])
+            redo=redo[~inside(param[redo])]
+        if len(redo) > 0:
+            raise ValueError("perturb: "+str(len(redo))+" proposals outside the support after maxredraw="+str(maxredraw)+" redraws. Check bounds/support and the population.")
+    return param
+
+def distance(Ysim,Ysm,nsample):
+    #sum of |sum(Ysim) - Ysm|/NSAMPLE (abcpmc.h)
+    return np.sum(np.abs(np.sum(Ysim,axis=1) - Ysm),axis=1)/nsample
+
+def hdistance(Ysim,Ysm,nsample):
+    #sum of sum|X - Y|/NSAMPLE/NDATA (habcpmc.h), Ysim(n,NSUBJECT,NSS,NDATA)
+    ndata=Ysim.shape[3]
+    Ysmsub=np.reshape(Ysm,(Ysim.shape[1],ndata))
+    return np.sum(np.abs(np.sum(Ysim,axis=2) - Ysmsub),axis=(1,2))/nsample/ndata
+
+def simulator(model,Ysm,nsample,ndata,rng,aux,metric=None):
+    #returns simulate(param) -> (rho, None) for the normal mode
+    #with metric (summary.Distance), simulate(param) -> (rho, per-component discrepancies)
+    def simulate(param):
+        Ysim=np.reshape(model(param,nsample,rng,aux),(len(param),nsample,ndata))
+        if metric is not None:
+            D=metric.discrepancy(Ysim)
+            return metric.rho(D), D
+        return distance(Ysim,Ysm,nsample), None
+    return simulate
+
+def hsimulator(model,prior,Ysm,nsample,ndata,nparam,nsubject,rng,aux):
+    #returns simulate(hparam) -> (rho, z) for the hierarchical mode
+    nss=int(nsample/nsubject)
+    def simulate(hparam):
+        n=len(hparam)
+        z=np.reshape(prior(hparam,nsubject,rng),(n,nsubject,nparam))
+        Ysim=np.reshape(model(z,nss,rng,aux),(n,nsubject,nss,ndata))
+        return hdistance(Ysim,Ysm,nsample), np.reshape(z,(n,nsubject*nparam))
+    return simulate
+
+def rejection(propose,simulate,islots,x,dist,ntry,epsilon,maxtryx,nbatch,z=None,verbose=True):
+    """repeat propose/simulate until each slot in islots has rho < epsilon.
+
+    Args:
+       propose: propose(n) -> param(n,nwparam)
+       simulate: simulate(param) -> (rho(n), z(n,nz) or None)
+       islots: particle indices to be filled
+       x, dist, ntry, z: output arrays, (npart,nwparam), (npart), (npart), (npart,nz)
+       epsilon: tolerance
+       maxtryx: MAXTRYX. x is NaN and ntry=MAXTRYX for a particle exceeding it.
+       nbatch: max number of the proposals simulated at once
+       verbose: print the particles exceeding maxtryx
+
+    Returns:
+       total number of the simulations
+    """
+    pending=np.asarray(islots)
+    ntry[pending]=0
+    nsim=0
+    nacc=0
+    while len(pending)>0:
+        slots=pending[:nbatch]
+        k=len(slots)
+        cnt=ntry[slots]
+        #tries per slot in this round (expected 1/acceptance)
+        rate=(nacc+1.0)/(nsim+1.0)
+        m=int(min(np.ceil(1.0/rate),max(1,nbatch//k),maxtryx-np.max(cnt)))
+        m=max(m,1)
+        param=propose(m*k)
+        rho,zs=simulate(param)
+        nsim=nsim+m*k
+        acc=np.reshape(rho<epsilon,(m,k))
+        hit=np.any(acc,axis=0)
+        first=np.argmax(acc,axis=0)
+        ih=np.nonzero(hit)[0]
+        iacc=first[ih]*k+ih # index in the proposals (try-major)
+        nacc=nacc+len(ih)
+
+        x[slots[ih]]=param[iacc]
+        dist[slots[ih]]=rho[iacc]
+        if z is not None:
+            z[slots[ih]]=zs[iacc]
+        ntry[slots]=cnt+m
+        ntry[slots[ih]]=cnt[ih]+first[ih]+1
+
+        #limitter
+        fail=(~hit)&(ntry[slots]>=maxtryx)
+        if verbose:
+            for i in slots[fail]:
+                print("EXCEED MAXTRYX. iblock="+str(i))
+        x[slots[fail]]=np.nan
+        ntry[slots[fail]]=maxtryx
+
+        done=np.zeros(len(pending),dtype=bool)
+        done[:k]=hit|fail
+        pending=pending[~done]
+
+    return nsim
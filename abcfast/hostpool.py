@@ -0,0 +1,213 @@
+import numpy as np
+import multiprocessing
+import weakref
+from multiprocessing import shared_memory
+from abcfast import hostpmc
+from abcfast import transition
+
+#Process-pool engine for the numpy backend.
+#
+#A generation is split into shards of particles (=CUDA blocks in abcpmc.h) and each shard runs
+#hostpmc.rejection in a worker process. The previous population, the alias tables, Qmat (or the packed
+#per-particle kernels), Ysm and aux are placed in multiprocessing.shared_memory, and the workers write
+#the accepted parameters, dist, ntry (and z) directly to the shared output arrays. Only the shard ranges
+#and the seeds are pickled.
+#
+#The workers are forked, so the python model/prior (lambda, closure) are not pickled either.
+#They, bounds/support and distance are captured at fork: HostPool.matches(abc) tells if the setting
+#changed since, and ABCpmc restarts the pool then.
+
+def create_shared(specs):
+    """create numpy arrays on the shared memory.
+
+    Args:
+       specs: dict of name: (shape, dtype)
+
+    Returns:
+       dict of SharedMemory, dict of arrays, dict of name: (shm name, shape, dtype) for attach_shared
+    """
+    shms={}
+    arrs={}
+    names={}
+    for key in specs:
+        shape,dtype=specs[key]
+        dtype=np.dtype(dtype)
+        nbytes=max(1,int(np.prod(shape))*dtype.itemsize)
+        shm=shared_memory.SharedMemory(create=True,size=nbytes)
+        shms[key]=shm
+        arrs[key]=np.ndarray(shape,dtype=dtype,buffer=shm.buf)
+        names[key]=(shm.name,shape,dtype.str)
+    return shms,arrs,names
+
+def attach_shared(names):
+    shms={}
+    arrs={}
+    for key in names:
+        shmname,shape,dtype=names[key]
+        shm=shared_memory.SharedMemory(name=shmname)
+        shms[key]=shm
+        arrs[key]=np.ndarray(shape,dtype=np.dtype(dtype),buffer=shm.buf)
+    return shms,arrs
+
+def release_shared(pool,shms):
+    pool.terminate()
+    for key in shms:
+        shms[key].close()
+        shms[key].unlink()
+
+_worker={}
+
+def _init_worker(conf,names):
+    _worker["conf"]=conf
+    _worker["shm"],_worker["arr"]=attach_shared(names)
+
+def _run_shard(i0,i1,seedseq,epsilon,init,maxtryx,verbose,local,dblock):
+    conf=_worker["conf"]
+    arr=_worker["arr"]
+    rng=np.random.default_rng(seedseq)
+    aux=arr["aux"] if conf["useaux"] else None
+    nwparam=conf["nwparam"]
+    metric=conf["distance"]
+    if metric is not None:
+        #scale of this generation, and the simulations kept for the next scale
+        metric.scale=np.copy(arr["dscale"])
+        metric.reset()
+        metric.nkeep=conf["nkeep"]
+    if conf["hyper"]:
+        simulate=hostpmc.hsimulator(conf["model"],conf["prior"],arr["Ysm"],conf["nsample"],conf["ndata"],conf["nparam"],conf["nsubject"],rng,aux)
+        sampler=conf["hyperprior"]
+        z=arr["z"]
+    else:
+        simulate=hostpmc.simulator(conf["model"],arr["Ysm"],conf["nsample"],conf["ndata"],rng,aux,metric)
+        sampler=conf["prior"]
+        z=arr["z"] if metric is not None else None
+
+    if init:
+        def propose(n):
+            return np.reshape(sampler(n,rng),(n,nwparam))
+    else:
+        Lpack=arr["Lpack"] if local else None
+        scratch=hostpmc.PerturbScratch(min(i1-i0,conf["nbatch"]),nwparam,local)
+        def propose(n):
+            return hostpmc.perturb(arr["xprev"],arr["Ki"],arr["Li"],arr["Ui"],arr["Qmat"],n,rng,Lpack,conf["inside"],dblock,scratch=scratch)
+
+    nsim=hostpmc.rejection(propose,simulate,np.arange(i0,i1),arr["xnew"],arr["dist"],arr["ntry"],epsilon,maxtryx,conf["nbatch"],z=z,verbose=verbose)
+    kept=metric.kept() if metric is not None and metric.adaptive else None
+    return nsim,kept
+
+def fork_setting(abc):
+    #the setting of abc captured by the forked workers (conf, Ysm and aux of HostPool)
+    return {"model":abc.model,"prior":abc.prior,"hyperprior":abc.hyperprior if abc.hyper else None,\
+            "nsample":abc.nsample,"ndata":abc.ndata,"nparam":abc.nparam,"nbatch":abc.nbatch,\
+            "nsubject":abc.nsubject if abc.hyper else None,\
+            "distance":abc.distance,"nkeep":None if abc.distance is None else abc.distance.nkeep,\
+            "bounds":None if abc.bounds is None else np.array(abc.bounds,dtype=np.float64),\
+            "support":abc.support,"Ysm":np.array(abc.Ysm),"aux":abc.aux}
+
+def same_setting(a,b):
+    #arrays by the content, numbers by the value, the others (functions, distance, aux) by the identity
+    for key in a:
+        va,vb=a[key],b[key]
+        if isinstance(va,np.ndarray) and isinstance(vb,np.ndarray):
+            if va.shape != vb.shape or not np.array_equal(va,vb):
+                return False
+        elif isinstance(va,(int,float,np.number)) and isinstance(vb,(int,float,np.number)):
+            if va != vb:
+                return False
+        elif va is not vb:
+            return False
+    return True
+
+class HostPool(object):
+    def __init__(self,abc,nprocess,nshard=None):
+        """process pool for ABCpmc (numpy backend).
+
+        Args:
+           abc: ABCpmc with backend="numpy"
+           nprocess: number of the worker processes
+           nshard: number of the shards per generation (default=4*nprocess, for load balancing)
+        """
+        self.nprocess=nprocess
+        self.nshard=4*nprocess if nshard is None else nshard
+        self.npart=abc.npart
+        self.hyper=abc.hyper
+        self.maxtryx=abc.maxtryx
+        nwparam=abc.nwparam
+
+        specs={"xprev":((self.npart,nwparam),np.float32),\
+               "xnew":((self.npart,nwparam),np.float32),\
+               "dist":((self.npart,),np.float32),\
+               "ntry":((self.npart,),np.int32),\
+               "Ki":((self.npart,),np.int32),\
+               "Li":((self.npart,),np.int32),\
+               "Ui":((self.npart,),np.float32),\
+               "Qmat":((nwparam*nwparam,),np.float32),\
+               "Lpack":((self.npart,nwparam*(nwparam+1)//2),np.float64),\
+               "Ysm":(np.shape(abc.Ysm),np.float32)}
+        useaux = abc.aux is not None
+        if useaux:
+            specs["aux"]=(np.shape(abc.aux),np.asarray(abc.aux).dtype)
+        if self.hyper:
+            specs["z"]=((self.npart,abc.nsubject*abc.nparam),np.float32)
+        elif abc.distance is not None:
+            specs["z"]=((self.npart,abc.distance.ncomp),np.float64)
+            specs["dscale"]=((abc.distance.ncomp,),np.float64)
+        self.shm,self.arr,names=create_shared(specs)
+        self.arr["Ysm"][:]=abc.Ysm
+        if useaux:
+            self.arr["aux"][:]=abc.aux
+
+        conf={"hyper":self.hyper,"model":abc.model,"prior":abc.prior,\
+              "hyperprior":abc.hyperprior if self.hyper else None,\
+              "nsample":abc.nsample,"ndata":abc.ndata,"nparam":abc.nparam,\
+              "nsubject":abc.nsubject if self.hyper else None,"nwparam":nwparam,\
+              "nbatch":max(1,int(abc.nbatch/abc.nsample)),"useaux":useaux,\
+              "distance":None if self.hyper else abc.distance,\
+              "inside":transition.support_function(abc.bounds,abc.support),\
+              "nkeep":0 if abc.distance is None else -(-abc.distance.nkeep//self.nshard)}
+        self.kept=[]
+        self.setting=fork_setting(abc)
+
+        ctx=multiprocessing.get_context("fork")
+        self.pool=ctx.Pool(nprocess,initializer=_init_worker,initargs=(conf,names))
+        self._finalizer=weakref.finalize(self,release_shared,self.pool,self.shm)
+
+    def run(self,epsilon,rng,xprev=None,Ki=None,Li=None,Ui=None,Qmat=None,maxtryx=None,verbose=True,dscale=None,Lpack=None,dblock=None):
+        """one generation. Sample from the prior when xprev is None.
+
+        Lpack (packed Cholesky factors of the per-particle kernels, transition.py) is used instead of Qmat if given.
+        dblock is the kick scale of the blocks (transition.block_scales), passed with the tasks.
+
+        maxtryx (default=abc.maxtryx) is the try budget of this generation.
+        dscale is the scale of abc.distance. The discrepancies kept by the workers are in self.kept.
+
+        Returns:
+           total number of the simulations
+        """
+        init = xprev is None
+        if dscale is not None:
+            self.arr["dscale"][:]=dscale
+        if maxtryx is None:
+            maxtryx=self.maxtryx
+        if not init:
+            self.arr["xprev"][:]=np.reshape(xprev,self.arr["xprev"].shape)
+            self.arr["Ki"][:]=Ki
+            self.arr["Li"][:]=Li
+            self.arr["Ui"][:]=Ui
+            self.arr["Qmat"][:]=np.ravel(np.asarray(Qmat))
+            if Lpack is not None:
+                self.arr["Lpack"][:]=Lpack
+
+        edges=np.linspace(0,self.npart,self.nshard+1).astype(int)
+        seeds=np.random.SeedSequence(int(rng.integers(2**63))).spawn(self.nshard)
+        tasks=[(edges[i],edges[i+1],seeds[i],epsilon,init,maxtryx,verbose,Lpack is not None,dblock) for i in range(self.nshard) if edges[i+1]>edges[i]]
+        res=self.pool.starmap(_run_shard,tasks)
+        self.kept=[kept for nsim,kept in res if kept is not None]
+        return int(np.sum([nsim for nsim,kept in res]))
+
+    def matches(self,abc):
+        #True if the workers still have the setting of abc (see fork_setting)
+        return same_setting(self.setting,fork_setting(abc))
+
+    def close(self):
+        self._finalizer()
@@ -0,0 +1,194 @@
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+from scipy.spatial import cKDTree
+from abcfast import transition
+
+#Host engine for the denominator of the ABC-PMC weight (compute_weight.h),
+#
+#   log sum_j wprev[j] exp(-0.5 (xnew[i]-xprev[j])^T cov^-1 (xnew[i]-xprev[j])).
+#
+#The populations are whitened once by the Cholesky factor (cov = L L^T, y = L^-1 x), so that
+#the quadratic form is |ynew[i]-yprev[j]|^2 = |ynew[i]|^2 + |yprev[j]|^2 - 2 ynew[i].yprev[j],
+#i.e. a matrix product per tile. The (nblock, nblock) tiles are accumulated by an online logsumexp,
+#so neither an npart x npart matrix is materialized nor exp(-0.5 qf) underflows.
+#Row blocks are distributed over a thread pool (numpy releases the GIL in matmul/exp).
+#Working memory is about 3*nthread*nblock**2*8 bytes.
+#
+#compute_logweight_approx truncates the sum to the neighbours within rcut kernel widths (KD-tree); it is
+#faster only for a kernel narrow relative to the population, and falls back to the exact engine otherwise.
+#
+#For the per-particle kernels (transition.py), the quadratic form with the precision P_j is also a
+#product of the features [x_i x_i^T, x_i] and [-P_j/2, P_j x_j] (compute_logweight_local).
+
+def whiten(x,cov):
+    L=np.linalg.cholesky(np.atleast_2d(np.asarray(cov,dtype=np.float64)))
+    Linv=np.linalg.inv(L)
+    return np.reshape(np.asarray(x,dtype=np.float64),(len(x),-1))@Linv.T
+
+def logsumexp_tiles(ynew,yprev,logwprev,nblock):
+    #log sum_j exp(logwprev[j] - 0.5|ynew[i]-yprev[j]|^2) for the rows ynew, tile by tile
+    rnew=np.sum(ynew**2,axis=1)
+    c=logwprev-0.5*np.sum(yprev**2,axis=1)
+    return logsumexp_dot(ynew,yprev,c,nblock)-0.5*rnew
+
+def logsumexp_dot(anew,bprev,c,nblock):
+    #log sum_j exp(anew[i].bprev[j] + c[j]) for the rows anew, tile by tile
+    m=np.full(len(anew),-np.inf)
+    s=np.zeros(len(anew))
+    for j in range(0,len(bprev),nblock):
+        a=anew@bprev[j:j+nblock].T
+        a+=c[np.newaxis,j:j+nblock]
+        mnew=np.maximum(m,np.max(a,axis=1))
+        shift=np.where(np.isfinite(mnew),mnew,0.0)
+        a-=shift[:,np.newaxis]
+        np.exp(a,out=a)
+        s=s*np.exp(m-shift)+np.sum(a,axis=1)
+        m=mnew
+    with np.errstate(divide="ignore"):
+        return np.log(s)+np.where(np.isfinite(m),m,0.0)
+
+def map_blocks(task,n,nblock,nthread):
+    #concatenated task(i) of the row blocks i=0,nblock,..., on a thread pool
+    if nthread is None:
+        nthread=os.cpu_count()
+    starts=range(0,n,nblock)
+    if nthread > 1 and len(starts) > 1:
+        with ThreadPoolExecutor(max_workers=nthread) as ex:
+            return np.concatenate(list(ex.map(task,starts)))
+    return np.concatenate([task(i) for i in starts])
+
+def compute_logweight(xnew,xprev,wprev,cov,nblock=512,nthread=None):
+    """log of the weight denominator, exact, blocked and threaded.
+
+    Args:
+       xnew: new population (npart,nwparam)
+       xprev: previous population (npart,nwparam)
+       wprev: previous weights (npart)
+       cov: covariance of the Gaussian transition kernel (nwparam,nwparam) or scalar
+       nblock: tile size (memory is bounded by nblock**2 per thread)
+       nthread: number of threads (default=os.cpu_count())
+
+    Returns:
+       log denominator (npart), without the normalization of the kernel
+    """
+    yprev=whiten(xprev,cov)
+    ynew=whiten(xnew,cov)
+    #centering reduces the cancellation in |y|^2 - 2 y.y'
+    y0=np.mean(yprev,axis=0)
+    yprev=yprev-y0
+    ynew=ynew-y0
+    with np.errstate(divide="ignore"):
+        logwprev=np.log(np.asarray(wprev,dtype=np.float64))
+
+    def task(i):
+        return logsumexp_tiles(ynew[i:i+nblock],yprev,logwprev,nblock)
+    return map_blocks(task,len(ynew),nblock,nthread)
+
+def compute_logweight_local(xnew,xprev,wprev,Lpack,logdet,nblock=512,nthread=None):
+    """log of the weight denominator with the per-particle kernels N(xnew[i]; xprev[j], L_j L_j^T), exact.
+
+    Args:
+       xnew: new population (npart,d)
+       xprev: previous population (npart,d)
+       wprev: previous weights (npart)
+       Lpack: packed Cholesky factors of the kernels of xprev (npart,d(d+1)/2), see transition.py
+       logdet: log det(L_j) (npart)
+       nblock: tile size
+       nthread: number of threads (default=os.cpu_count())
+
+    Returns:
+       log denominator (npart), without the common normalization (2 pi)^-d/2
+    """
+    xprev=np.reshape(np.asarray(xprev,dtype=np.float64),(len(xprev),-1))
+    xnew=np.reshape(np.asarray(xnew,dtype=np.float64),(len(xnew),-1))
+    d=xprev.shape[1]
+    x0=np.mean(xprev,axis=0)
+    xprev=xprev-x0
+    xnew=xnew-x0
+    Linv=np.linalg.inv(transition.unpack(Lpack,d))
+    P=np.einsum("nki,nkj->nij",Linv,Linv)
+    iu=np.triu_indices(d)
+    fac=np.where(iu[0]==iu[1],1.0,2.0)
+    Px=np.einsum("nij,nj->ni",P,xprev)
+    anew=np.concatenate([xnew[:,iu[0]]*xnew[:,iu[1]]*fac,xnew],axis=1)
+    bprev=np.concatenate([-0.5*P[:,iu[0],iu[1]],Px],axis=1)
+    with np.errstate(divide="ignore"):
+        c=np.log(np.asarray(wprev,dtype=np.float64))-0.5*np.sum(xprev*Px,axis=1)-logdet
+
+    def task(i):
+        return logsumexp_dot(anew[i:i+nblock],bprev,c,nblock)
+    return map_blocks(task,len(xnew),nblock,nthread)
+
+def compute_logweight_approx(xnew,xprev,wprev,cov,rcut=5.0,npair=2**22,maxfrac=0.02,nprobe=512,nblock=512,nthread=None,rng=None):
+    """log of the weight denominator, truncated to the neighbours within rcut kernel widths.
+
+    The neighbours in the whitened space (|ynew[i]-yprev[j]| < rcut) are found by a KD-tree,
+    so the cost is about O(N log N + number of the neighbour pairs) instead of O(N^2).
+    Each dropped term is smaller than wprev[j] exp(-rcut^2/2), hence the dropped mass of the row i
+    is bounded by exp(-rcut^2/2) (sum(wprev) - sum of the kept wprev). A row without any neighbour
+    is computed exactly.
+
+    This pays only if the kernel is narrow relative to the population (e.g. wide=10 makes the whitened
+    population about one kernel width across, and every pair is a neighbour). The mean number of the
+    neighbours is estimated on nprobe rows first, and above maxfrac*N the exact tiled engine
+    (compute_logweight) is used instead, with a zero bound. The rows are processed in blocks of at most
+    npair neighbour pairs, so the pair records take about 24*npair bytes.
+
+    Args:
+       xnew: new population (npart,nwparam)
+       xprev: previous population (npart,nwparam)
+       wprev: previous weights (npart)
+       cov: covariance of the Gaussian transition kernel (nwparam,nwparam) or scalar
+       rcut: truncation radius in units of the kernel width
+       npair: max number of the neighbour pairs materialized at once
+       maxfrac: max mean fraction of the neighbours per row for the truncation
+       nprobe: number of the rows sampled for the neighbour density
+       nblock, nthread: tile size and threads of the exact fallback
+       rng: numpy.random.Generator for the probe rows (default: the first rows are evenly spaced)
+
+    Returns:
+       log denominator (npart), upper bound of the relative dropped mass (npart)
+    """
+    yprev=whiten(xprev,cov)
+    ynew=whiten(xnew,cov)
+    wprev=np.asarray(wprev,dtype=np.float64)
+    tree=cKDTree(yprev)
+    #neighbour density
+    if rng is None:
+        probe=np.linspace(0,len(ynew)-1,min(nprobe,len(ynew))).astype(np.int64)
+    else:
+        probe=rng.choice(len(ynew),min(nprobe,len(ynew)),replace=False)
+    if np.mean(tree.query_ball_point(ynew[probe],rcut,return_length=True)) > maxfrac*len(yprev):
+        return compute_logweight(xnew,xprev,wprev,cov,nblock,nthread),np.zeros(len(ynew))
+
+    wmax=np.max(wprev)
+    wn=wprev/wmax
+    wsum=np.sum(wn)
+    #row blocks of at most npair pairs (a single row may exceed it)
+    counts=tree.query_ball_point(ynew,rcut,return_length=True)
+    cum=np.cumsum(counts)
+    edges=[0]
+    while edges[-1] < len(ynew):
+        base=cum[edges[-1]-1] if edges[-1] > 0 else 0
+        edges.append(max(edges[-1]+1,int(np.searchsorted(cum,base+npair,side="right"))))
+    den=np.zeros(len(ynew))
+    wkept=np.zeros(len(ynew))
+    for i0,i1 in zip(edges[:-1],edges[1:]):
+        yb=ynew[i0:i1]
+        pairs=cKDTree(yb).sparse_distance_matrix(tree,rcut,output_type="ndarray")
+        den[i0:i1]=np.bincount(pairs["i"],weights=wn[pairs["j"]]*np.exp(-0.5*pairs["v"]**2),minlength=len(yb))
+        wkept[i0:i1]=np.bincount(pairs["i"],weights=wn[pairs["j"]],minlength=len(yb))
+
+    with np.errstate(divide="ignore",invalid="ignore"):
+        logden=np.log(den)+np.log(wmax)
+        bound=np.exp(-0.5*rcut**2)*np.maximum(wsum-wkept,0.0)/den
+
+    #isolated rows
+    iso=np.nonzero(den==0.0)[0]
+    if len(iso)>0:
+        y0=np.mean(yprev,axis=0)
+        with np.errstate(divide="ignore"):
+            logden[iso]=logsumexp_tiles(ynew[iso]-y0,yprev-y0,np.log(wprev),nblock)
+        bound[iso]=0.0
+    return logden,bound
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import re
+import tempfile
+
+#Content-hashed build of the cuda kernels.
+#
+#The key of a built artifact (cubin) is the sha256 of the generated source (with the #defines),
+#the compiler options, the compiler target (e.g. sm_61) and the contents of the headers included
+#by #include "..." (searched in CPLUS_INCLUDE_PATH). Artifacts are kept in an in-process registry and
+#in an on-disk cache (ABCFAST_CACHE_DIR or ~/.cache/abcfast), so an identical configuration is
+#compiled only once across runs, processes and jobs.
+#
+#The compiler is pluggable: any object with
+#   target() -> str, compile(source, options) -> bytes, load(binary) -> module
+#can be given to KernelBuilder, e.g. a stub compiler on a machine without GPU.
+
+def default_cachedir():
+    return os.environ.get("ABCFAST_CACHE_DIR",os.path.join(os.path.expanduser("~"),".cache","abcfast"))
+
+def include_dirs():
+    dirs=[d for d in os.environ.get("CPLUS_INCLUDE_PATH","").split(os.pathsep) if d]
+    root=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return dirs+[os.path.join(root,"include"),os.path.join(root,"models")]
+
+def included_headers(source,dirs,found=None):
+    #paths of the headers included by #include "..." (recursive)
+    if found is None:
+        found=[]
+    for name in re.findall(r'#include\s+"([^"]+)"',source):
+        for d in dirs:
+            path=os.path.join(d,name)
+            if os.path.isfile(path):
+                if path not in found:
+                    found.append(path)
+                    with open(path) as f:
+                        included_headers(f.read(),dirs,found)
+                break
+    return found
+
+def build_key(source,options,target,dirs=None):
+    if dirs is None:
+        dirs=include_dirs()
+    h=hashlib.sha256()
+    h.update(source.encode())
+    h.update(("\0"+" ".join(options)+"\0"+target+"\0").encode())
+    for path in included_headers(source,dirs):
+        with open(path,"rb") as f:
+            h.update(os.path.basename(path).encode()+b"\0"+f.read())
+    return h.hexdigest()
+
+class CudaCompiler(object):
+    #nvcc via pycuda
+    def target(self):
+        import pycuda.driver as cuda
+        major,minor=cuda.Context.get_device().compute_capability()
+        return "sm_"+str(major)+str(minor)
+
+    def compile(self,source,options):
+        from pycuda.compiler import compile
+        return compile(source,options=list(options),no_extern_c=True,arch=self.target())
+
+    def load(self,binary):
+        import pycuda.driver as cuda
+        return cuda.module_from_buffer(binary)
+
+class KernelBuilder(object):
+    def __init__(self,compiler=None,cachedir=None):
+        """build (or fetch) cuda modules keyed by the content hash.
+
+        Args:
+           compiler: see the module comment (default=CudaCompiler())
+           cachedir: on-disk cache directory (default=default_cachedir(), False=no disk cache)
+        """
+        self.compiler=CudaCompiler() if compiler is None else compiler
+        self.cachedir=default_cachedir() if cachedir is None else cachedir
+        self.registry={}
+        self.ncompile=0
+
+    def build(self,source,options):
+        key=build_key(source,options,self.compiler.target())
+        if key in self.registry:
+            return self.registry[key]
+
+        binary=None
+        if self.cachedir:
+            path=os.path.join(self.cachedir,key+".cubin")
+            if os.path.isfile(path):
+                with open(path,"rb") as f:
+                    binary=f.read()
+        if binary is None:
+            binary=self.compiler.compile(source,options)
+            self.ncompile=self.ncompile+1
+            if self.cachedir:
+                #atomic write for concurrent jobs
+                os.makedirs(self.cachedir,exist_ok=True)
+                fd,tmp=tempfile.mkstemp(dir=self.cachedir,suffix=".tmp")
+                with os.fdopen(fd,"wb") as f:
+                    f.write(binary)
+                os.replace(tmp,path)
+
+        module=self.compiler.load(binary)
+        self.registry[key]=module
+        return module
+
+_builder=None
+
+def default_builder():
+    global _builder
+    if _builder is None:
+        _builder=KernelBuilder()
+    return _builder
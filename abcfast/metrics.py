@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+import numpy as np
+
+#Per-generation metrics of ABCpmc.
+#
+#ABCpmc times the phases of each generation (PhaseTimer) and, when sinks are set (ABCpmc.sinks),
+#emits one record per generation to every sink:
+#
+#   generation, epsilon, acceptance (npart/sum(ntry)), ntry_mean/max/min/p50/p90/p99, ess, resampled,
+#   nsim (simulations in this generation), nsim_total, time_simulation, time_transfer, time_covariance,
+#   time_weights, time_alias (sec), time_total (wall time of the generation from the start of ABCpmc.run
+#   to the record, incl. pilot, schedule and resampling) and time_other (time_total - the timed phases)
+#
+#Sinks: MemorySink (list), JSONLinesSink (file), PrometheusSink (textfile for the node_exporter
+#textfile collector). A sink is any object with emit(record).
+
+phases=["simulation","transfer","covariance","weights","alias"]
+
+class PhaseTimer(object):
+    def __init__(self):
+        self.times={}
+        self.start=time.perf_counter()
+
+    def reset(self):
+        #start of a generation
+        self.times={}
+        self.start=time.perf_counter()
+
+    def elapsed(self):
+        #wall time since reset
+        return time.perf_counter()-self.start
+
+    @contextmanager
+    def __call__(self,phase):
+        t0=time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[phase]=self.times.get(phase,0.0)+time.perf_counter()-t0
+
+def record(abc):
+    ntry=np.asarray(abc.ntry)
+    p50,p90,p99=np.percentile(ntry,[50.0,90.0,99.0])
+    rec={"generation":abc.iteration-1,
+         "epsilon":float(abc.epsilon),
+         "acceptance":len(ntry)/float(np.sum(ntry)),
+         "ntry_mean":float(np.mean(ntry)),"ntry_max":int(np.max(ntry)),"ntry_min":int(np.min(ntry)),
+         "ntry_p50":float(p50),"ntry_p90":float(p90),"ntry_p99":float(p99),
+         "ess":None if abc.ess is None else float(abc.ess),
+         "resampled":bool(abc.resampled),
+         "nsim":int(abc.nsim),
+         "nsim_total":int(abc.nsim_total)}
+    timed=0.0
+    for phase in phases:
+        t=abc.timer.times.get(phase,0.0)
+        rec["time_"+phase]=t
+        timed=timed+t
+    rec["time_total"]=abc.timer.elapsed()
+    rec["time_other"]=max(rec["time_total"]-timed,0.0)
+    return rec
+
+class MemorySink(object):
+    def __init__(self):
+        self.records=[]
+
+    def emit(self,rec):
+        self.records.append(rec)
+
+class JSONLinesSink(object):
+    def __init__(self,path):
+        """append the records to a JSON-lines file."""
+        self.path=path
+
+    def emit(self,rec):
+        with open(self.path,"a") as f:
+            f.write(json.dumps(rec)+"\n")
+
+class PrometheusSink(object):
+    def __init__(self,path,prefix="abcfast",labels=None):
+        """write the last record as gauges to a Prometheus textfile (atomic rewrite).
+
+        Args:
+           path: textfile (*.prom) in the directory of the node_exporter textfile collector
+           prefix: metric name prefix
+           labels: dict of labels added to every metric, e.g. {"run":"bin12"}
+        """
+        self.path=path
+        self.prefix=prefix
+        self.labels=labels
+
+    def emit(self,rec):
+        label=""
+        if self.labels:
+            label="{"+",".join(key+'="'+str(val)+'"' for key,val in self.labels.items())+"}"
+        lines=[]
+        for key,val in rec.items():
+            if val is None:
+                continue
+            name=self.prefix+"_"+key
+            lines.append("# TYPE "+name+" "+("counter" if key == "nsim_total" else "gauge"))
+            lines.append(name+label+" "+repr(float(val)))
+        dirname=os.path.dirname(os.path.abspath(self.path))
+        fd,tmp=tempfile.mkstemp(dir=dirname,suffix=".tmp")
+        with os.fdopen(fd,"w") as f:
+            f.write("\n".join(lines)+"\n")
+        os.replace(tmp,self.path)
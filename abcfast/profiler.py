@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+import numpy as np
+from abcfast import metrics
+
+#Opt-in phase profiler of ABCpmc.
+#
+#   with Profiler(abc) as prof:
+#       for i in range(n):
+#           abc.run()
+#   prof.write_trace("trace.json")   # chrome://tracing or https://ui.perfetto.dev
+#   print(prof.summary())
+#
+#While active, the profiler replaces abc.timer, so every phase timed by ABCpmc (simulation, transfer,
+#covariance, weights, alias) becomes a span of the trace. For the numpy backend, propose, simulate and
+#the model calls are also spanned, and each model call gives a sample of the per-particle simulation
+#cost (time/number of the particles in the call). The distance reduction is simulate minus model.
+#With nprocess > 1, the simulation runs in the workers and only the simulation phase is timed.
+#
+#memory=True traces the host allocations (tracemalloc) and records the peak of each span.
+#The bytes of the numpy arrays held by abc are recorded at the end of each generation.
+#Outside the with block, ABCpmc keeps its plain PhaseTimer and nothing is wrapped.
+
+class Profiler(metrics.PhaseTimer):
+    def __init__(self,abc,memory=False):
+        """phase profiler.
+
+        Args:
+           abc: ABCpmc
+           memory: trace the peak host memory of each span (tracemalloc, slower)
+        """
+        super(Profiler,self).__init__()
+        self.abc=abc
+        self.memory=memory
+        self.events=[]
+        self.stack=[]
+        self.cost=[] # (number of the particles, sec/particle) of each model call
+        self.host_bytes=[]
+        self.t0=time.perf_counter()
+        self.tgen=None
+        self.pid=os.getpid()
+        self.saved=None
+
+    def __enter__(self):
+        self.saved=self.abc.timer
+        self.abc.timer=self
+        self.abc.profiler=self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started=True
+        else:
+            self.started=False
+        return self
+
+    def __exit__(self,*args):
+        self.abc.timer=self.saved
+        self.abc.profiler=None
+        if self.started:
+            tracemalloc.stop()
+        return False
+
+    def reset(self):
+        #start of a generation
+        super(Profiler,self).reset()
+        self.tgen=time.perf_counter()
+
+    def __call__(self,phase,**args):
+        return _Span(self,phase,args)
+
+    def span(self,name,t0,t1,peak=None,args=None):
+        event={"name":name,"cat":"abcfast","ph":"X","ts":(t0-self.t0)*1.e6,"dur":(t1-t0)*1.e6,
+               "pid":self.pid,"tid":threading.get_ident()}
+        args=dict(args) if args else {}
+        if peak is not None:
+            args["peak_bytes"]=peak
+        if args:
+            event["args"]=args
+        self.events.append(event)
+
+    def generation(self,abc):
+        #end of a generation
+        t1=time.perf_counter()
+        if self.tgen is not None:
+            self.span("generation "+str(abc.iteration-1),self.tgen,t1)
+        nbytes=sum(val.nbytes for val in vars(abc).values() if isinstance(val,np.ndarray))
+        self.host_bytes.append(nbytes)
+        self.events.append({"name":"host arrays","ph":"C","ts":(t1-self.t0)*1.e6,"pid":self.pid,"args":{"bytes":nbytes}})
+
+    def wrap(self,propose,simulate):
+        #spanned propose/simulate of the numpy backend
+        def tpropose(n):
+            with self("propose",n=n):
+                return propose(n)
+        def tsimulate(param):
+            with self("simulate",n=len(param)):
+                return simulate(param)
+        return tpropose,tsimulate
+
+    def wrap_model(self,model):
+        #spanned model, with the per-particle cost
+        def tmodel(param,*args):
+            t0=time.perf_counter()
+            with self("model",n=len(param)):
+                Ysim=model(param,*args)
+            self.cost.append((len(param),(time.perf_counter()-t0)/len(param)))
+            return Ysim
+        return tmodel
+
+    def totals(self):
+        #name: [calls, total sec, peak bytes]
+        tot={}
+        for event in self.events:
+            if event["ph"] != "X" or event["name"].startswith("generation"):
+                continue
+            t=tot.setdefault(event["name"],[0,0.0,None])
+            t[0]=t[0]+1
+            t[1]=t[1]+event["dur"]*1.e-6
+            peak=event.get("args",{}).get("peak_bytes")
+            if peak is not None:
+                t[2]=peak if t[2] is None else max(t[2],peak)
+        if "simulate" in tot and "model" in tot:
+            tot["distance (simulate-model)"]=[tot["simulate"][0],tot["simulate"][1]-tot["model"][1],None]
+        return tot
+
+    def write_trace(self,path):
+        with open(path,"w") as f:
+            json.dump({"traceEvents":self.events,"displayTimeUnit":"ms"},f)
+
+    def summary(self):
+        gens=[event["dur"]*1.e-6 for event in self.events if event["ph"] == "X" and event["name"].startswith("generation")]
+        trun=sum(gens)
+        lines=["generations: "+str(len(gens))+", wall time: "+"{:.4f}".format(trun)+" sec"]
+        lines.append("{:<28}{:>8}{:>12}{:>12}{:>8}{:>12}".format("phase","calls","total[s]","mean[ms]","%","peak[MB]"))
+        for name,(ncall,t,peak) in sorted(self.totals().items(),key=lambda item: -item[1][1]):
+            frac=100.0*t/trun if trun > 0 else 0.0
+            peakstr="-" if peak is None else "{:.2f}".format(peak/2**20)
+            lines.append("{:<28}{:>8}{:>12.4f}{:>12.4f}{:>8.1f}{:>12}".format(name,ncall,t,1.e3*t/ncall,frac,peakstr))
+        if self.cost:
+            n,c=np.array(self.cost).T
+            lines.append("per-particle simulation cost [us]: mean={:.3f} median={:.3f} p90={:.3f} ({} calls, {} particles)".format(
+                1.e6*np.sum(n*c)/np.sum(n),1.e6*np.median(c),1.e6*np.percentile(c,90.0),len(c),int(np.sum(n))))
+        if self.host_bytes:
+            lines.append("host arrays of ABCpmc: last={:.2f} MB, peak={:.2f} MB".format(self.host_bytes[-1]/2**20,max(self.host_bytes)/2**20))
+        return "\n".join(lines)
+
+class _Span(object):
+    #context of a span, with the peak host memory of nested spans
+    def __init__(self,prof,name,args):
+        self.prof=prof
+        self.name=name
+        self.args=args
+
+    def __enter__(self):
+        if self.prof.memory:
+            self.childpeak=0
+            if self.prof.stack:
+                parent=self.prof.stack[-1]
+                parent.childpeak=max(parent.childpeak,tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.prof.stack.append(self)
+        self.t0=time.perf_counter()
+        return self
+
+    def __exit__(self,*args):
+        t1=time.perf_counter()
+        prof=self.prof
+        prof.stack.pop()
+        prof.times[self.name]=prof.times.get(self.name,0.0)+t1-self.t0
+        peak=None
+        if prof.memory:
+            peak=max(tracemalloc.get_traced_memory()[1],self.childpeak)
+            if prof.stack:
+                parent=prof.stack[-1]
+                parent.childpeak=max(parent.childpeak,peak)
+        prof.span(self.name,self.t0,t1,peak,self.args)
+        return False
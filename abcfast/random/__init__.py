@@ -0,0 +1,20 @@
+__all__ = ["normal","gamma","poisson","binomial","alias",
+           "normf","norm2df","normgivencov","qmat","expf","rayleighf","gammaf","betaf",
+           "poissonf","binomialf","alias_init","aliasgen","mvn","factor","mvnf"]
+
+#Batched host (numpy) samplers with the parameterisations of include/gen*.h, for the python models
+#and priors of the numpy backend. rng is a numpy.random.Generator, size is the batch shape (default:
+#the broadcast shape of the parameters) and out an optional preallocated output.
+
+from . import normal
+from . import gamma
+from . import poisson
+from . import binomial
+from . import alias
+from . import mvn
+from .normal import normf, norm2df, normgivencov, qmat, expf, rayleighf
+from .gamma import gammaf, betaf
+from .poisson import poissonf
+from .binomial import binomialf
+from .alias import alias_init, aliasgen
+from .mvn import factor, mvnf
@@ -0,0 +1,9 @@
+import numpy as np
+
+def output(out,size,dtype,*params):
+    #out, or a new array of size (default: broadcast shape of the params)
+    if out is not None:
+        return out
+    if size is None:
+        size=np.broadcast_shapes(*[np.shape(p) for p in params])
+    return np.empty(size,dtype=dtype)
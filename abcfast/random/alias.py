@@ -0,0 +1,20 @@
+import numpy as np
+from abcfast.utils.statutils import genalias_init
+
+#Discrete sampling by the alias method (genalias.h).
+#
+#   Ki,Li,Ui = alias_init(parrs)     : table of the (unnormalized) probabilities parrs
+#   index = aliasgen(Ki,Li,Ui,n,rng) : n draws of the index
+
+def alias_init(parrs):
+    return genalias_init(parrs,dtype=np.float64)
+
+def aliasgen(Ki,Li,Ui,n,rng,out=None):
+    #vectorized aliasgen in genalias.h
+    nt=len(Ui)
+    pb=rng.random(n)*nt
+    index=pb.astype(np.int64)
+    if out is None:
+        return np.where(Ui[index] < pb - index, Ki[index], Li[index])
+    out[...]=np.where(Ui[index] < pb - index, Ki[index], Li[index])
+    return out
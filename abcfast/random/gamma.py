@@ -0,0 +1,111 @@
+import numpy as np
+from abcfast.random._util import output
+
+#Gamma and beta (gengamma.h, random_beta.py).
+#
+#   gammaf(a, b)          : Gamma with shape a and rate b (mean a/b), 0 for a <= 0
+#   betaf(alpha, beta)    : g_a/(g_a + g_b) with g_a ~ Gamma(alpha,1), g_b ~ Gamma(beta,1)
+#
+#gengamma.h runs Marsaglia & Tsang (2000) per draw and gives up after MAXTRY tries ("EXCEED MAXTRY", 0).
+#marsaglia_tsang runs it on a batch: every pending slot gets ntry candidates (rn, U) in one pass, the
+#candidates are accepted in bulk by the squeeze U < 1 - 0.0331 rn^4 (or the log test for the few others),
+#and only the slots with no accepted candidate are refilled, until all the slots are filled (the acceptance
+#is > 0.95 for any shape, so there is no failure path). The boost of a < 1, Gamma(a) = Gamma(a+1) U^(1/a),
+#is applied to every slot as U^e with e = 1/a for a < 1 and e = 0 otherwise, without a branch.
+#
+#gammaf(ntry=None) uses numpy.random.Generator.standard_gamma (compiled, also without a failure path), which is
+#~2x faster on the host; gammaf(ntry=k) runs marsaglia_tsang(ntry=k), the fixed-cost batch path of
+#array operations. See benchmarks/bench_gamma.py.
+
+def marsaglia_tsang(a,m,rng,ntry=1):
+    """standard gamma by Marsaglia & Tsang (2000), vectorized.
+
+    Args:
+       a: shape > 0, scalar or (m)
+       m: number of the draws
+       rng: numpy.random.Generator
+       ntry: number of the candidates per pending slot and pass
+
+    Returns:
+       x (m)
+    """
+    a=np.asarray(a,dtype=np.float64)
+    low=(a < 1.0)
+    d=a+low-1.0/3.0
+    c=1.0/np.sqrt(9.0*d)
+    x=np.empty(m)
+    idx=np.arange(m)
+    while len(idx) > 0:
+        mm=len(idx)
+        #candidates flat (ntry*mm), the candidate i is of the slot i%mm
+        if a.ndim == 0 or (ntry == 1 and mm == m):
+            dc,cc=d,c
+        else:
+            col=np.tile(idx,ntry)
+            dc,cc=d[col],c[col]
+        y=rng.standard_normal(ntry*mm)
+        u=rng.random(ntry*mm)
+        v=cc*y
+        v+=1.0
+        y*=y
+        acc=(v > 0.0)&(u < 1.0-0.0331*y*y)
+        v*=v*v
+        i=np.nonzero(~acc&(v > 0.0))[0]
+        di=dc if a.ndim == 0 else dc[i]
+        acc[i]=np.log(u[i]) < 0.5*y[i]+di*(1.0-v[i]+np.log(v[i]))
+        v*=dc
+        acc=np.reshape(acc,(ntry,mm))
+        v=np.reshape(v,(ntry,mm))
+        if ntry == 1:
+            ok,v=acc[0],v[0]
+        else:
+            first=np.argmax(acc,axis=0)
+            cols=np.arange(mm)
+            ok,v=acc[first,cols],v[first,cols]
+        x[idx[ok]]=v[ok]
+        idx=idx[~ok]
+    #boost of a < 1
+    if a.ndim > 0:
+        x*=rng.random(m)**np.where(low,1.0/a,0.0)
+    elif low:
+        x*=rng.random(m)**(1.0/a)
+    return x
+
+def gammaf(a,b,rng,size=None,out=None,ntry=None):
+    """Gamma with shape a and rate b (0 for a <= 0).
+
+    Args:
+       a: shape, scalar or array broadcast to size
+       b: rate, scalar or array broadcast to size
+       rng: numpy.random.Generator
+       size: batch shape (default: broadcast shape of a and b)
+       out: output
+       ntry: None (numpy), or the candidates per slot and pass of marsaglia_tsang (ntry>1: fixed-cost batches)
+
+    Returns:
+       out
+    """
+    out=output(out,size,np.float64,a,b)
+    if ntry is None:
+        out[...]=rng.standard_gamma(np.maximum(a,0.0),size=out.shape)
+    elif np.ndim(a) == 0:
+        if a > 0.0:
+            out[...]=np.reshape(marsaglia_tsang(a,out.size,rng,ntry),out.shape)
+        else:
+            out[...]=0.0
+    else:
+        a=np.broadcast_to(np.asarray(a,dtype=np.float64),out.shape).ravel()
+        pos=np.nonzero(a > 0.0)[0]
+        x=np.zeros(out.size)
+        x[pos]=marsaglia_tsang(a[pos],len(pos),rng,ntry)
+        out[...]=np.reshape(x,out.shape)
+    out/=b
+    return out
+
+def betaf(alpha,beta,rng,size=None,out=None,ntry=None):
+    out=output(out,size,np.float64,alpha,beta)
+    gb=gammaf(beta,1.0,rng,size=out.shape,ntry=ntry)
+    gammaf(alpha,1.0,rng,out=out,ntry=ntry)
+    gb+=out
+    out/=gb
+    return out
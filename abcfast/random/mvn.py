@@ -0,0 +1,91 @@
+import hashlib
+import numpy as np
+
+#d-dimensional multivariate normal (random_norm2d.py, random_norm2d_givencov.py for any d).
+#
+#   L = factor(cov)                      : Cholesky factor, L L^T = cov, of (d,d) or per row (n,d,d)
+#   mvnf(mu, cov, rng, out=out, z=z)     : out = mu + L z, z ~ N(0,1)
+#
+#The factors are cached by the content of the covariance (shape, dtype and a digest of the bytes), so
+#a covariance used by a model or a prior is factorized once even if the array is rebuilt in each call,
+#and modifying it in place gives a new entry. The cache keeps the last maxcache factors. A covariance
+#used only once (e.g. the transition kernel of a generation) is factorized with factor(cov, cache=False).
+#A positive semidefinite covariance (no Cholesky factor) is factorized by the eigendecomposition,
+#eigenvectors * sqrt(|eigenvalues|).
+#
+#With out (n,d) and the scratch z (n,d) given, mvnf does not allocate: z is filled by
+#Generator.standard_normal(out=z), and L z is written into out by matmul.
+
+_cache={}
+maxcache=64
+
+def _key(cov):
+    return (cov.shape,cov.dtype.str,hashlib.blake2b(np.ascontiguousarray(cov).tobytes(),digest_size=16).digest())
+
+def forget(cov=None):
+    #drop the cached factor of cov (all if None)
+    if cov is None:
+        _cache.clear()
+    else:
+        _cache.pop(_key(np.asarray(cov)),None)
+
+def _factorize(cov):
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        lam,vec=np.linalg.eigh(cov)
+        return vec*np.sqrt(np.abs(lam))[...,np.newaxis,:]
+
+def factor(cov,cache=True):
+    """factor L (L L^T = cov), cached by the content of cov.
+
+    Args:
+       cov: covariance (d,d), or per row (n,d,d)
+       cache: look up and store the factor in the cache
+
+    Returns:
+       L, lower triangular unless cov is singular
+    """
+    cov=np.asarray(cov)
+    if not cache:
+        return _factorize(cov.astype(np.float64,copy=False))
+    key=_key(cov)
+    L=_cache.get(key)
+    if L is not None:
+        return L
+    L=_factorize(cov.astype(np.float64,copy=False))
+    if len(_cache) >= maxcache:
+        del _cache[next(iter(_cache))]
+    _cache[key]=L
+    return L
+
+def mvnf(mu,cov,rng,size=None,out=None,z=None,L=None):
+    """multivariate normal mu + L rn.
+
+    Args:
+       mu: mean (d) or per row (n,d)
+       cov: covariance (d,d), or per row (n,d,d) (ignored with L)
+       rng: numpy.random.Generator
+       size: number of the rows n (default: 1, or the rows of the per-row mu/cov)
+       out: output (n,d)
+       z: scratch for the standard normals (n,d), same dtype as out
+       L: factor(s) of the covariance instead of cov, (d,d) or (n,d,d)
+
+    Returns:
+       out
+    """
+    if L is None:
+        L=factor(cov)
+    d=L.shape[-1]
+    if out is None:
+        n=size if size is not None else L.shape[0] if L.ndim == 3 else len(mu) if np.ndim(mu) == 2 else 1
+        out=np.empty((n,d))
+    if z is None:
+        z=np.empty(out.shape,dtype=out.dtype)
+    rng.standard_normal(z.shape,dtype=z.dtype,out=z)
+    if L.ndim == 2:
+        np.matmul(z,L.T,out=out)
+    else:
+        np.matmul(L,z[:,:,np.newaxis],out=out[:,:,np.newaxis])
+    out+=mu
+    return out
@@ -0,0 +1,93 @@
+import numpy as np
+from abcfast.random._util import output
+
+#Normal family (gennorm.h, gennorm2d.h, random_norm2d_givencov.py, random_exponential.py, random_rayleigh.py).
+#
+#   normf(mu, sigma)        : mu + sigma rn
+#   norm2df(hparam)         : 2D gaussian, hparam = [mu0, mu1, a, b, c], covariance [[a,c],[c,b]]
+#   normgivencov(mu, Qmat)  : mu + Qmat rn, Qmat Qmat^T = cov, e.g. qmat(cov) or mvn.factor(cov) (ABCpmc.Qmat is the Cholesky factor)
+#   expf(lambda)            : -log(U)/lambda
+#   rayleighf()             : sqrt(rn1^2 + rn2^2) (sigma=1)
+
+def normf(mu,sigma,rng,size=None,out=None):
+    out=output(out,size,np.float64,mu,sigma)
+    rng.standard_normal(out.shape,dtype=out.dtype,out=out)
+    out*=sigma
+    out+=mu
+    return out
+
+def norm2df(hparam,rng,size=None,out=None):
+    """2D gaussian of gennorm2df.
+
+    Args:
+       hparam: [mu0, mu1, a, b, c] (..., 5)
+       rng: numpy.random.Generator
+       size: batch shape (default: hparam.shape[:-1])
+       out: output (size..., 2)
+
+    Returns:
+       out
+    """
+    h=np.asarray(hparam,dtype=np.float64)
+    mu0,mu1,a,b,c=np.moveaxis(h,-1,0)
+    if out is None:
+        out=np.empty(tuple(np.append(h.shape[:-1] if size is None else size,2).astype(int)))
+    rn=rng.standard_normal(out.shape)
+    #rows of the factor, x = E rn (E = diag(sqrt(a),sqrt(b)) for c=0)
+    fac=np.sqrt(a*a-2*a*b+b*b+4*c*c)/2
+    with np.errstate(divide="ignore",invalid="ignore"):
+        sqrt_lam1=np.sqrt(np.maximum(a/2+b/2-fac,0.0))
+        sqrt_lam2=np.sqrt(a/2+b/2+fac)
+        e1=-c/(a/2-b/2+fac)
+        n1=np.sqrt(e1*e1+1.0)
+        e2=-c/(a/2-b/2-fac)
+        n2=np.sqrt(e2*e2+1.0)
+        diag=(c == 0.0)
+        e11=np.where(diag,np.sqrt(a),sqrt_lam1*e1/n1)
+        e12=np.where(diag,0.0,sqrt_lam1/n1)
+        e21=np.where(diag,0.0,sqrt_lam2*e2/n2)
+        e22=np.where(diag,np.sqrt(b),sqrt_lam2/n2)
+    out[...,0]=e11*rn[...,0]+e21*rn[...,1]+mu0
+    out[...,1]=e12*rn[...,0]+e22*rn[...,1]+mu1
+    return out
+
+def qmat(cov):
+    #Qmat with Qmat Qmat^T = cov by the eigendecomposition, eigenvectors * sqrt(|eigenvalues|) (also for a singular cov)
+    lam,vec=np.linalg.eigh(np.asarray(cov,dtype=np.float64))
+    return vec*np.sqrt(np.abs(lam))
+
+def normgivencov(mu,Qmat,rng,size=None,out=None):
+    """gaussian mu + Qmat rn of random_norm2d_givencov.py, any dimension d.
+
+    Args:
+       mu: mean (d)
+       Qmat: factor of the covariance (d,d), e.g. qmat(cov) or mvn.factor(cov)
+       rng: numpy.random.Generator
+       size: number of the samples n
+       out: output (n,d)
+
+    Returns:
+       out
+    """
+    Q=np.asarray(Qmat,dtype=np.float64)
+    d=Q.shape[0]
+    if out is None:
+        out=np.empty((1 if size is None else size,d))
+    rn=rng.standard_normal(out.shape)
+    np.matmul(rn,Q.T,out=out)
+    out+=mu
+    return out
+
+def expf(lam,rng,size=None,out=None):
+    out=output(out,size,np.float64,lam)
+    rng.standard_exponential(out.shape,dtype=out.dtype,out=out)
+    out/=lam
+    return out
+
+def rayleighf(rng,size=None,out=None):
+    #rn1^2 + rn2^2 is chi2 with 2 dof = 2*Exp(1)
+    out=output(out,size,np.float64)
+    rng.standard_exponential(out.shape,dtype=out.dtype,out=out)
+    out*=2.0
+    np.sqrt(out,out=out)
+    return out
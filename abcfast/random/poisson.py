@@ -0,0 +1,143 @@
+import numpy as np
+from scipy.special import gammaln
+from abcfast.random._util import output
+
+#Poisson (genpoisson.h): poissonf(lambda), int64.
+#
+#genpoisson.h inverts outward from the mode, O(sqrt(lambda)) steps per draw, and returns -1 after
+#NMAXPOI steps. Here the cost per draw is O(1) for any lambda, with no failure value:
+#
+#   lambda <  LAMSMALL : exact inversion, searchsorted in the cdf table for a common lambda,
+#                        sequential search from 0 vectorized over the pending draws otherwise
+#   lambda >= LAMSMALL : transformed rejection with squeeze, PTRS (Hoermann 1993).
+#                        The squeeze accepts most of the candidates without evaluating the pmf.
+#
+#ptrs rejects in bulk: every pending slot gets ntry candidates in one pass and takes the first accepted
+#one, and only the slots with no accepted candidate are refilled. With ntry>1 (e.g. 4) all the slots do the
+#same work and the refill is rare (probability (1-acceptance)^ntry per slot), i.e. a fixed-cost batch path
+#made of array operations only (the layout of a SIMD or device port).
+#
+#poissonf(ntry=None) takes the fastest exact path on the host: the cdf table for a common small lambda,
+#and numpy.random.Generator.poisson (compiled PTRS for lambda >= 10) otherwise, which is about 2x faster than
+#the array-op PTRS (benchmarks/bench_poisson.py). poissonf(ntry=k) uses inversion and ptrs(ntry=k).
+
+LAMSMALL=10.0
+
+def inversion_table(lam,u):
+    #common lam < LAMSMALL, the tail beyond kmax is below 1e-30
+    ks=np.arange(int(lam+20.0*np.sqrt(lam)+40.0))
+    cdf=np.cumsum(np.exp(-lam+ks*np.log(lam)-gammaln(ks+1.0)))
+    cdf[-1]=1.0
+    return np.searchsorted(cdf,u,side="right")
+
+def inversion(lam,u):
+    #smallest k with u < cdf(k), lam (n) < LAMSMALL
+    k=np.empty(len(u),dtype=np.int64)
+    idx=np.arange(len(u))
+    p=np.exp(-lam)
+    cdf=p.copy()
+    j=0
+    while len(idx) > 0:
+        pend=(u >= cdf)&(p > 0.0)
+        k[idx[~pend]]=j
+        idx,lam,u,p,cdf=idx[pend],lam[pend],u[pend],p[pend],cdf[pend]
+        j=j+1
+        p*=lam/j
+        cdf+=p
+    return k
+
+def ptrs(lam,n,rng,ntry=1):
+    """PTRS of Hoermann (1993), vectorized.
+
+    Args:
+       lam: mean >= LAMSMALL, scalar or (n)
+       n: number of the draws
+       rng: numpy.random.Generator
+       ntry: number of the candidates per pending slot and pass
+
+    Returns:
+       k (n) int64
+    """
+    lam=np.asarray(lam,dtype=np.float64)
+    b=0.931+2.53*np.sqrt(lam)
+    par=(lam,np.log(lam),b,-0.059+0.02483*b,1.1239+1.1328/(b-3.4),0.9277-3.6224/(b-2.0))
+    k=np.empty(n,dtype=np.int64)
+    idx=np.arange(n)
+    while len(idx) > 0:
+        m=len(idx)
+        lm,loglam,b,a,ainv,vr=par if lam.ndim == 0 or m == n else [q[idx] for q in par]
+        #candidates flat (ntry*m), the candidate i is of the slot i%m
+        UV=rng.random((2,ntry*m))
+        U=UV[0]
+        V=UV[1]
+        U-=0.5
+        us=np.abs(U)
+        np.subtract(0.5,us,out=us)
+        with np.errstate(divide="ignore",invalid="ignore"):
+            kc=2.0*a/us if lam.ndim == 0 else 2.0*np.tile(a,ntry)/us
+        kc+=b if lam.ndim == 0 else np.tile(b,ntry)
+        kc*=U
+        kc+=lm+0.43 if lam.ndim == 0 else np.tile(lm+0.43,ntry)
+        np.floor(kc,out=kc)
+        acc=(us >= 0.07)&(V <= vr if lam.ndim == 0 else V <= np.tile(vr,ntry))
+        #candidates beyond the squeeze: the exact test
+        i=np.nonzero(~acc)[0]
+        ui,kk,vi=us[i],kc[i],V[i]
+        t=(kk >= 0.0)&((ui >= 0.013)|(vi <= ui))
+        i,ui,kk=i[t],ui[t],kk[t]
+        if lam.ndim > 0:
+            im=i%m
+            lm,loglam,b,a,ainv=lm[im],loglam[im],b[im],a[im],ainv[im]
+        acc[i]=np.log(vi[t]*ainv/(a/(ui*ui)+b)) <= -lm+kk*loglam-gammaln(kk+1.0)
+        acc=np.reshape(acc,(ntry,m))
+        kc=np.reshape(kc,(ntry,m))
+        if ntry == 1:
+            ok,kc=acc[0],kc[0]
+        else:
+            first=np.argmax(acc,axis=0)
+            cols=np.arange(m)
+            ok,kc=acc[first,cols],kc[first,cols]
+        k[idx[ok]]=kc[ok]
+        idx=idx[~ok]
+    return k
+
+def poissonf(lam,rng,size=None,out=None,ntry=None):
+    """Poisson with mean lambda (0 for lambda <= 0).
+
+    Args:
+       lam: mean, scalar or array broadcast to size
+       rng: numpy.random.Generator
+       size: batch shape (default: lam.shape)
+       out: output, int64
+       ntry: None (fastest path), or the candidates per slot and pass of ptrs (ntry>1: fixed-cost batches)
+
+    Returns:
+       out
+    """
+    out=output(out,size,np.int64,lam)
+    n=out.size
+    if np.ndim(lam) == 0:
+        lam=float(lam)
+        if lam <= 0.0:
+            out[...]=0
+        elif lam < LAMSMALL:
+            out[...]=np.reshape(inversion_table(lam,rng.random(n)),out.shape)
+        elif ntry is None:
+            out[...]=rng.poisson(lam,size=out.shape)
+        else:
+            out[...]=np.reshape(ptrs(lam,n,rng,ntry),out.shape)
+        return out
+    lam=np.broadcast_to(np.asarray(lam,dtype=np.float64),out.shape)
+    if ntry is None:
+        out[...]=rng.poisson(np.maximum(lam,0.0))
+        return out
+    lam=lam.ravel()
+    k=np.zeros(n,dtype=np.int64)
+    small=np.nonzero((lam > 0.0)&(lam < LAMSMALL))[0]
+    large=np.nonzero(lam >= LAMSMALL)[0]
+    if len(small) > 0:
+        k[small]=inversion(lam[small],rng.random(len(small)))
+    if len(large) > 0:
+        k[large]=ptrs(lam[large],len(large),rng,ntry)
+    out[...]=np.reshape(k,out.shape)
+    return out
@@ -0,0 +1,47 @@
+import numpy as np
+
+#Recovery of the particles exceeding the try budget (MAXTRYX).
+#
+#A particle exceeding the budget is NaN in x (abcpmc.h, habcpmc.h, hostpmc.rejection). With
+#ABCpmc.nrecover > 0, run() relaunches only the NaN slots with fresh random numbers and a budget
+#larger by ABCpmc.recover_factor per round, and merges them into the population (ntry counts all the
+#tries). With ABCpmc.tryfactor, the first pass of a generation (numpy backend) is limited to
+#tryfactor times the tryquantile of the previous ntry, so a straggler is relaunched early instead of
+#running up to MAXTRYX. The cuda kernels take the slot list and the try budget as arguments
+#(slot=NULL and MAXTRYX for the full grid), hence the cuda backend launches a grid of len(failed) blocks
+#with a new seed, and the kernel writes the failed slots only.
+#
+#If particles are still NaN after the rounds, MaxTryError is raised with the partial population.
+
+class MaxTryError(Exception):
+    def __init__(self,message,failed,x,dist,ntry,z=None,epsilon=None,iteration=None):
+        """particles exceeded the try budget.
+
+        Args:
+           message: message
+           failed: indices of the failed particles
+           x, dist, ntry, z: copies of the partial population (failed rows of x are NaN)
+           epsilon: tolerance of the generation
+           iteration: index of the generation
+        """
+        super(MaxTryError,self).__init__(message)
+        self.failed=failed
+        self.x=x
+        self.dist=dist
+        self.ntry=ntry
+        self.z=z
+        self.epsilon=epsilon
+        self.iteration=iteration
+
+def failed_slots(x):
+    #indices of the NaN rows of x (npart,nwparam)
+    return np.nonzero(np.any(np.isnan(x),axis=1))[0]
+
+def try_budget(ntry,maxtryx,tryfactor,tryquantile=0.99):
+    #try budget of a generation from the ntry of the previous generation
+    q=np.quantile(np.asarray(ntry),tryquantile)
+    return int(min(maxtryx,max(1,np.ceil(tryfactor*q))))
+
+def recovery_seed(seed,iteration,iround):
+    #fresh curand seed of a relaunch (fits int32)
+    return int(np.random.SeedSequence([max(seed,0),iteration,iround]).generate_state(1)[0]>>1)
@@ -0,0 +1,66 @@
+import numpy as np
+
+#Resampling of the weighted population (ABCpmc.resampling).
+#
+#   multinomial : npart i.i.d. draws from w (np.random.choice, the default)
+#   systematic  : u_k = (k + u)/npart with one uniform u
+#   stratified  : u_k = (k + u_k)/npart with one uniform per stratum
+#   residual    : floor(npart w_i) copies of i, multinomial draws from the residuals for the rest
+#
+#All are unbiased (the expected number of the copies of i is npart w_i). Systematic, stratified and
+#residual resampling have a smaller variance of the number of the copies than multinomial, so less
+#noise is added to the population. systematic and residual are O(npart) (copy counts expanded in place in the output).
+#rng is a numpy.random.Generator, or the np.random module (cuda backend).
+
+methods=["multinomial","systematic","stratified","residual"]
+
+def counts_index(counts,out):
+    #indices with the copy counts, written into out (sum(counts)) in place:
+    #the index steps at the first copy of each drawn particle, then a cumulative sum
+    nz=np.flatnonzero(counts)
+    start=np.cumsum(counts[nz])-counts[nz]
+    out.fill(0)
+    out[start]=np.diff(nz,prepend=0)
+    np.cumsum(out,out=out)
+    return out
+
+def resample(w,n,method,rng,out=None):
+    """indices of the resampled particles.
+
+    Args:
+       w: normalized weights (npart)
+       n: number of the draws
+       method: one of methods
+       rng: numpy.random.Generator or np.random
+       out: output array (n) of int64, allocated if None
+
+    Returns:
+       out
+    """
+    if out is None:
+        out=np.empty(n,dtype=np.int64)
+    w=np.asarray(w,dtype=np.float64)
+    if method == "multinomial":
+        out[:]=rng.choice(len(w),n,p=w)
+        return out
+    if method == "residual":
+        nw=n*w
+        counts=np.floor(nw).astype(np.int64)
+        nrest=n-int(np.sum(counts))
+        if nrest > 0:
+            r=nw-counts
+            counts+=rng.multinomial(nrest,r/np.sum(r))
+        return counts_index(counts,out)
+    cdf=np.cumsum(w)
+    cdf/=cdf[-1] # guard the round-off of the last value
+    if method == "systematic":
+        #number of u_k <= cdf[i] is floor(n cdf[i] - u) + 1
+        u=rng.random()
+        ncum=np.clip(np.floor(n*cdf-u).astype(np.int64)+1,0,n)
+        ncum[-1]=n
+        return counts_index(np.diff(ncum,prepend=0),out)
+    if method == "stratified":
+        u=(np.arange(n)+rng.random(n))/n
+        out[:]=np.minimum(np.searchsorted(cdf,u,side="right"),len(w)-1)
+        return out
+    raise ValueError("resample: unknown method "+str(method))
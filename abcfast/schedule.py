@@ -0,0 +1,41 @@
+import numpy as np
+
+class QuantileSchedule(object):
+    def __init__(self,quantile=0.5,pilot_quantile=0.1,npilot=None,min_acceptance=1.e-3,epsilon_min=0.0,maxiter=100):
+        """adaptive epsilon schedule (set ABCpmc.schedule instead of epsilon_list).
+
+        epsilon_0 is the pilot_quantile of the distances of a pilot batch from the prior predictive.
+        The next epsilon is the quantile of the accepted distances of the current generation.
+        The run stops when the acceptance rate npart/sum(ntry) falls below min_acceptance,
+        epsilon reaches epsilon_min, or the number of the generations reaches maxiter.
+
+        Args:
+           quantile: quantile of the accepted distances for the next epsilon
+           pilot_quantile: quantile of the pilot distances for epsilon_0
+           npilot: size of the pilot batch (None=npart). The cuda backend uses npart.
+           min_acceptance: stop when the acceptance rate is below this value
+           epsilon_min: stop when epsilon <= epsilon_min
+           maxiter: max number of the generations
+        """
+        self.quantile=quantile
+        self.pilot_quantile=pilot_quantile
+        self.npilot=npilot
+        self.min_acceptance=min_acceptance
+        self.epsilon_min=epsilon_min
+        self.maxiter=maxiter
+
+    def initial(self,dist):
+        dist=dist[np.isfinite(dist)]
+        return float(np.quantile(dist,self.pilot_quantile))
+
+    def next(self,dist,epsilon):
+        dist=dist[np.isfinite(dist)]
+        return min(float(np.quantile(dist,self.quantile)),float(epsilon))
+
+    def acceptance(self,ntry):
+        return len(ntry)/float(np.sum(ntry))
+
+    def stop(self,ntry,epsilon,iteration):
+        if iteration == 0:
+            return False
+        return self.acceptance(ntry) < self.min_acceptance or epsilon <= self.epsilon_min or iteration >= self.maxiter
@@ -0,0 +1,145 @@
+import sys
+import numpy as np
+
+#Summary statistics and scaled distances (numpy backend, normal mode).
+#
+#A summary gives the per-component discrepancies D(n,k) between a batch of simulated datasets
+#Ysim(n,NSAMPLE,NDATA) and the observed data Yobs(NSAMPLE',NDATA):
+#
+#   Mean, Var          : |mean - mean_obs|, |var - var_obs| per data component
+#   Quantiles(q)       : |quantile - quantile_obs| per q and data component
+#   Autocov(lags)      : |autocovariance - autocovariance_obs| per lag and data component
+#   Wasserstein        : W1 between the empirical distributions per data component (sorted samples)
+#
+#Distance(summaries, Yobs) concatenates them and rho = sum_k D_k/scale_k. The scale of each component is
+#fixed (array), or estimated as the MAD (or std) of D_k over the simulations of a generation (adaptive,
+#Prangle 2017), so that a large-valued component does not dominate rho. Set ABCpmc.distance to use it.
+#ABCpmc keeps D of the accepted particles (ABCpmc.dcomp) and recomputes dist with the new scale at the end
+#of each generation, so the epsilon schedule sees the distances in the current units.
+#
+#Kernel snippet: Distance([Mean()],Yobs,scale=...).kernel_source() gives the scaled version of the
+#kernel distance (sum |mean(Ysim) - mean(Yobs)|/scale), with the scale in __constant__ memory.
+#The kernels reduce only the sums of the samples, so the other summaries exit with an error there.
+
+class Mean(object):
+    def stats(self,Y):
+        return np.mean(Y,axis=-2)
+
+class Var(object):
+    def stats(self,Y):
+        return np.var(Y,axis=-2)
+
+class Quantiles(object):
+    def __init__(self,q=(0.1,0.5,0.9)):
+        self.q=np.asarray(q)
+
+    def stats(self,Y):
+        #(nq, ..., ndata) -> (..., nq*ndata)
+        S=np.quantile(Y,self.q,axis=-2)
+        return np.reshape(np.moveaxis(S,0,-2),S.shape[1:-1]+(-1,))
+
+class Autocov(object):
+    def __init__(self,lags=(1,)):
+        self.lags=lags
+
+    def stats(self,Y):
+        Yc=Y-np.mean(Y,axis=-2,keepdims=True)
+        nsample=Y.shape[-2]
+        return np.concatenate([np.sum(Yc[...,lag:,:]*Yc[...,:nsample-lag,:],axis=-2)/nsample for lag in self.lags],axis=-1)
+
+class Wasserstein(object):
+    #W1 per data component: mean |sorted Ysim - quantiles of Yobs at (i+0.5)/NSAMPLE|
+    def fit(self,Yobs,nsample):
+        p=(np.arange(nsample)+0.5)/nsample
+        self.qobs=np.quantile(Yobs,p,axis=0)
+
+    def discrepancy(self,Ysim):
+        return np.mean(np.abs(np.sort(Ysim,axis=1)-self.qobs),axis=1)
+
+class Distance(object):
+    def __init__(self,summaries,Yobs,nsample,scale="mad",nkeep=20000):
+        """scaled L1 distance of the summaries.
+
+        Args:
+           summaries: list of Mean(), Var(), Quantiles(q), Autocov(lags), Wasserstein()
+           Yobs: observed data (NSAMPLE', NDATA) or (NSAMPLE')
+           nsample: NSAMPLE of the simulations
+           scale: "mad" or "std" (adaptive), or an array of the fixed scales (k)
+           nkeep: max number of the simulations kept per generation for the scale estimate
+        """
+        self.summaries=summaries
+        self.Yobs=np.reshape(np.asarray(Yobs,dtype=np.float64),(len(Yobs),-1))
+        self.sobs=[]
+        for summ in summaries:
+            if isinstance(summ,Wasserstein):
+                summ.fit(self.Yobs,nsample)
+                self.sobs.append(None)
+            else:
+                self.sobs.append(summ.stats(self.Yobs))
+        if isinstance(scale,str):
+            if scale not in ["mad","std"]:
+                sys.exit("Error: scale should be mad, std or an array.")
+            self.method=scale
+            self.scale=None
+        else:
+            self.method=None
+            self.scale=np.asarray(scale,dtype=np.float64)
+        self.ncomp=sum(self.Yobs.shape[1] if sobs is None else np.size(sobs) for sobs in self.sobs)
+        self.nkeep=nkeep
+        self.reservoir=[]
+        self.nkept=0
+
+    @property
+    def adaptive(self):
+        return self.method is not None
+
+    def discrepancy(self,Ysim,keep=True):
+        #D(n,k) of Ysim(n,NSAMPLE,NDATA), kept in the reservoir for the scale estimate
+        D=np.concatenate([summ.discrepancy(Ysim) if sobs is None else np.abs(summ.stats(Ysim)-sobs) \
+                          for summ,sobs in zip(self.summaries,self.sobs)],axis=1)
+        if keep and self.adaptive and self.nkept < self.nkeep:
+            self.reservoir.append(D[:self.nkeep-self.nkept])
+            self.nkept=self.nkept+len(self.reservoir[-1])
+        return D
+
+    def rho(self,D):
+        if self.scale is None:
+            return np.sum(D,axis=1)
+        return D@(1.0/self.scale)
+
+    def reset(self):
+        self.reservoir=[]
+        self.nkept=0
+
+    def kept(self):
+        if len(self.reservoir) == 0:
+            return np.zeros((0,self.ncomp))
+        return np.concatenate(self.reservoir)
+
+    def add(self,D):
+        #simulations of the workers (hostpool)
+        if len(D) > 0:
+            self.reservoir.append(D)
+            self.nkept=self.nkept+len(D)
+
+    def update_scale(self):
+        #MAD (or std) of D over the kept simulations, then reset the reservoir
+        D=self.kept()
+        self.reset()
+        if not self.adaptive or len(D) < 2:
+            return
+        if self.method == "mad":
+            scale=1.4826*np.median(np.abs(D-np.median(D,axis=0)),axis=0)
+        else:
+            scale=np.std(D,axis=0)
+        self.scale=np.where(scale > 0.0,scale,np.max(scale) if np.max(scale) > 0.0 else 1.0)
+
+    def kernel_source(self):
+        #scaled kernel distance, sum |mean(Ysim) - Ysm/NSAMPLE|/dscale (abcpmc.h, abcpmc_init.h)
+        if len(self.summaries) != 1 or not isinstance(self.summaries[0],Mean):
+            names=",".join(type(summ).__name__ for summ in self.summaries)
+            sys.exit("Error: the cuda backend supports Distance([Mean()],...) only, got ["+names+"]. Use the numpy backend for Var, Quantiles, Autocov and Wasserstein.")
+        return """
+    __constant__ float dscale[NDATA];
+    #define DSCALE(m) dscale[m]
+    """
@@ -0,0 +1,144 @@
+import csv
+import multiprocessing
+import os
+import time
+import numpy as np
+
+#Grid sweep of many ABC-PMC problems sharing one setup (e.g. the (P, Rp) bins of gabcpmc_planet.py).
+#
+#   shared = load()                          # once: catalogs, aux, ...
+#   abc = setup(params, shared)              # per bin: configured ABCpmc (model, prior, Ysm, epsilon_list/schedule)
+#   row = summary(abc)                       # per bin: dict of the results
+#
+#Each bin runs abc.run() until abc.stop(). The rows are appended to a CSV table (params, results,
+#nsim, time) as soon as a bin finishes, and the bins already in the table are skipped, so an
+#interrupted sweep resumes where it stopped.
+#
+#With nprocess > 1, the bins are scheduled over a forked process pool. shared is inherited by the
+#workers (not pickled), and setup/summary can be closures. Use the numpy backend with abc.nprocess=1
+#in the workers; a CUDA context cannot be used across fork, so the cuda backend runs the bins
+#in this process (nprocess=1, a ValueError is raised otherwise). The compiled kernels are reused through kernelcache
+#(in-process registry and the on-disk cache) whenever the generated source of the bins is identical.
+
+def default_summary(abc,percentiles=(15.87,50.0,84.13)):
+    #median and 1 sigma range of each parameter of the last generation
+    x=np.reshape(abc.x,(abc.npart,abc.nwparam))
+    row={}
+    for k in range(abc.nwparam):
+        lo,med,hi=np.percentile(x[:,k],percentiles)
+        row["x"+str(k)+"_median"]=med
+        row["x"+str(k)+"_lo"]=lo
+        row["x"+str(k)+"_hi"]=hi
+    return row
+
+def bin_key(params,names):
+    return tuple(repr(float(params[name])) for name in names)
+
+def bin_seed(seed,ibin):
+    #independent seed of each bin (fits int32 for curand)
+    return int(np.random.SeedSequence(seed,spawn_key=(ibin,)).generate_state(1)[0]>>1)
+
+def run_bin(setup,summary,params,shared,seed,forked=False):
+    t0=time.time()
+    abc=setup(params,shared)
+    if forked and abc.backend == "cuda":
+        raise ValueError("Sweep: the cuda backend runs with nprocess=1.")
+    abc.seed=seed
+    abc.check_preparation()
+    nsim=0
+    while True:
+        abc.run()
+        nsim=nsim+int(np.sum(abc.ntry))
+        if abc.stop():
+            break
+    row=summary(abc)
+    row["niter"]=abc.iteration
+    row["nsim"]=nsim
+    row["time"]=time.time()-t0
+    abc.close_pool()
+    return row
+
+_conf=None
+
+def _init_worker(conf):
+    global _conf
+    _conf=conf
+
+def _run_task(task):
+    ibin,params,seed=task
+    setup,summary,shared=_conf
+    return ibin,params,run_bin(setup,summary,params,shared,seed,forked=True)
+
+class Sweep(object):
+    def __init__(self,setup,output,shared=None,summary=None,nprocess=1,seed=1):
+        """sweep over the bins sharing one setup.
+
+        Args:
+           setup: function(params, shared) -> configured ABCpmc
+           output: path of the output table (CSV)
+           shared: data loaded once and given to every setup (e.g. aux)
+           summary: function(abc) -> dict of the results (default=default_summary)
+           nprocess: number of the worker processes (numpy backend, ValueError for the cuda backend)
+           seed: base seed, the seed of each bin is derived from seed and the bin index
+        """
+        self.setup=setup
+        self.output=output
+        self.shared=shared
+        self.summary=default_summary if summary is None else summary
+        self.nprocess=nprocess
+        self.seed=seed
+
+    def completed(self,names):
+        #keys of the bins in the output table
+        done=set()
+        if os.path.isfile(self.output):
+            with open(self.output,newline="") as f:
+                for row in csv.DictReader(f):
+                    done.add(bin_key(row,names))
+        return done
+
+    def write(self,params,names,result):
+        row=dict(params)
+        row.update(result)
+        exists=os.path.isfile(self.output) and os.path.getsize(self.output) > 0
+        with open(self.output,"a",newline="") as f:
+            writer=csv.DictWriter(f,fieldnames=list(names)+[key for key in result])
+            if not exists:
+                writer.writeheader()
+            writer.writerow(row)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def run(self,bins):
+        """run the bins not yet in the output table.
+
+        Args:
+           bins: list of dict of the bin parameters (same keys), e.g. [{"Pmin":256.0,"Pmax":500.0,...},...]
+
+        Returns:
+           number of the bins run
+        """
+        if len(bins) == 0:
+            return 0
+        names=list(bins[0].keys())
+        done=self.completed(names)
+        todo=[(i,params,bin_seed(self.seed,i)) for i,params in enumerate(bins) if bin_key(params,names) not in done]
+        print("SWEEP: ",len(bins)-len(todo),"/",len(bins),"bins completed.")
+
+        if self.nprocess > 1 and len(todo) > 1:
+            #the backend is that of the ABCpmc built by setup (the workers check each bin as well)
+            if self.setup(todo[0][1],self.shared).backend == "cuda":
+                raise ValueError("Sweep: the cuda backend runs with nprocess=1 (a CUDA context cannot be used across fork).")
+            ctx=multiprocessing.get_context("fork")
+            with ctx.Pool(self.nprocess,initializer=_init_worker,initargs=((self.setup,self.summary,self.shared),)) as pool:
+                for ibin,params,result in pool.imap_unordered(_run_task,todo):
+                    self.write(params,names,result)
+        else:
+            for ibin,params,seed in todo:
+                result=run_bin(self.setup,self.summary,params,self.shared,seed)
+                self.write(params,names,result)
+        return len(todo)
+
+def load_table(path):
+    """read the output table as a numpy structured array."""
+    return np.genfromtxt(path,delimiter=",",names=True)
@@ -0,0 +1,213 @@
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.stats import norm
+
+#Transition kernels of ABC-PMC (numpy backend).
+#
+#ABCpmc.transition selects the Gaussian kernel K(x|x_j) of the perturbation x = x_j + L_j rn:
+#
+#   "global"   : wide*cov(x), unweighted, common to all the particles (abcpmc.h, default)
+#   "weighted" : wide*cov(x) weighted by w, common to all the particles (Beaumont et al. 2009: wide=2)
+#   "olcm"     : optimal local covariance matrix (Filippi et al. 2013),
+#                Sigma_j = sum_k w_k (x_k - x_j)(x_k - x_j)^T over the particles with dist <= the new epsilon
+#   "knn"      : wide*weighted cov of the knn nearest neighbours of x_j (whitened by the weighted cov)
+#
+#With ABCpmc.target_acceptance, wide is replaced by a per-dimension scale vector (ABCpmc.pscale) tuned
+#after each generation (tune_scale): the common factor follows the acceptance rate npart/sum(ntry) toward
+#the target (Robbins-Monro in log), and a dimension whose marginal std contracted faster than the others
+#gets a relatively narrower kernel, anticipating its further contraction. The covariance is scaled as
+#diag(sqrt(pscale)) cov diag(sqrt(pscale)) (scale_cov).
+#
+#The kernels are built from the weighted population at the start of a generation. The per-particle
+#Cholesky factors are stored packed (npart, d(d+1)/2, lower triangle), and the weight denominator
+#includes the normalisation det(Sigma_j)^-1/2 of each kernel (hostweight.compute_logweight_local).
+#
+#Blocks: with ABCpmc.blocks, a proposal moves one block of the parameters, chosen uniformly, with the
+#full kernel width and the other parameters only by block_jitter times the width, i.e. the kernel of
+#the block b is D_b Sigma D_b with D_b = 1 in b and block_jitter elsewhere (block_scales). The weight
+#denominator is the mixture over the blocks, so the weights stay exact (a pure subset move would not
+#have a density). blocks=k partitions the parameters randomly into blocks of k at every generation.
+#
+#Support: with ABCpmc.bounds and/or ABCpmc.support (vectorized predicate), a perturbed param outside the
+#support is redrawn from the kernel of the same particle before any simulation (hostpmc.perturb), i.e.
+#the kernel of x_j is truncated to the support and renormalised by its mass c_j in the support
+#(support_mass: exact for a diagonal kernel and bounds, Monte Carlo with common random numbers otherwise).
+#The weight denominator becomes sum_j w_j K_j(x)/c_j.
+
+methods=["global","weighted","olcm","knn"]
+
+def weighted_cov(x,w):
+    w=np.asarray(w,dtype=np.float64)/np.sum(w)
+    mu=w@x
+    dx=x-mu
+    return (dx*w[:,np.newaxis]).T@dx, mu
+
+def scale_cov(cov,scale):
+    #scale*cov, or diag(sqrt(scale)) cov diag(sqrt(scale)) per dimension (also for (n,d,d))
+    if np.ndim(scale) == 0:
+        return scale*cov
+    s=np.sqrt(np.asarray(scale,dtype=np.float64))
+    return cov*(s[:,np.newaxis]*s[np.newaxis,:])
+
+def tune_scale(pscale,acceptance,target,gain=0.5,contraction=None,bounds=(1.e-3,1.e3)):
+    """per-dimension scale of the kernel covariance for the next generation.
+
+    Args:
+       pscale: current scale (d)
+       acceptance: acceptance rate of the generation, npart/sum(ntry)
+       target: target acceptance rate
+       gain: step size in log
+       contraction: ratio of the marginal std of the new population to the previous one (d)
+       bounds: min and max of the scale
+
+    Returns:
+       new scale (d)
+    """
+    logp=np.log(pscale)+gain*(np.log(acceptance)-np.log(target))
+    if contraction is not None:
+        lq=np.log(np.clip(contraction,1.e-12,None))
+        logp=logp+gain*(lq-np.mean(lq))
+    return np.clip(np.exp(logp),bounds[0],bounds[1])
+
+def block_scales(d,blocks,jitter,rng):
+    """scale of the kick per block, D (nblock,d), 1 in the block and jitter elsewhere.
+
+    Args:
+       d: number of the parameters
+       blocks: block size (random partition) or list of the index lists of the blocks
+       jitter: relative width of the parameters outside the block
+       rng: numpy.random.Generator
+
+    Returns:
+       D (nblock,d)
+    """
+    if np.ndim(blocks) == 0:
+        perm=rng.permutation(d)
+        blocks=[perm[i:i+blocks] for i in range(0,d,blocks)]
+    D=np.full((len(blocks),d),float(jitter))
+    for k,b in enumerate(blocks):
+        D[k,np.asarray(b,dtype=int)]=1.0
+    return D
+
+def scale_factor(Lpack,D):
+    #packed Cholesky factors of diag(D) Sigma_j diag(D)
+    il=np.tril_indices(len(D))
+    return Lpack*D[il[0]]
+
+def pack(L):
+    #(n,d,d) lower triangular -> (n,d(d+1)/2)
+    il=np.tril_indices(L.shape[-1])
+    return L[:,il[0],il[1]]
+
+def unpack(Lpack,d,out=None):
+    #(n,d(d+1)/2) -> (n,d,d)
+    if out is None:
+        out=np.zeros((len(Lpack),d,d))
+    il=np.tril_indices(d)
+    out[:,il[0],il[1]]=Lpack
+    return out
+
+def cholesky(cov,ridge):
+    #batched Cholesky factor with a ridge (ridge*diag) for the degenerate kernels (e.g. resampled duplicates)
+    d=cov.shape[-1]
+    diag=np.diagonal(cov,axis1=-2,axis2=-1)
+    reg=ridge*np.where(diag > 0.0,diag,1.0)
+    return np.linalg.cholesky(cov+reg[...,np.newaxis]*np.eye(d))
+
+def local_kernels(x,w,method,wide=1.0,dist=None,epsilon=None,knn=None,ridge=1.e-9):
+    """per-particle kernels.
+
+    Args:
+       x: population (npart,d)
+       w: weights (npart)
+       method: "olcm" or "knn"
+       wide: scale factor of the covariance, scalar or per dimension (see scale_cov)
+       dist, epsilon: distances of the population and the new tolerance (olcm)
+       knn: number of the neighbours (knn, default=max(2d+1,npart/4))
+       ridge: relative ridge added to the diagonals
+
+    Returns:
+       packed Cholesky factors (npart,d(d+1)/2), log det(L_j) (npart)
+    """
+    x=np.asarray(x,dtype=np.float64)
+    w=np.asarray(w,dtype=np.float64)
+    npart,d=x.shape
+    if method == "olcm":
+        #sum_k w_k (x_k - x_j)(x_k - x_j)^T = C + (mu - x_j)(mu - x_j)^T over the subset
+        sel=np.ones(npart,dtype=bool)
+        if dist is not None and epsilon is not None:
+            sel=np.asarray(dist) <= epsilon
+            if np.count_nonzero(sel) < d+1:
+                sel[:]=True
+        C,mu=weighted_cov(x[sel],w[sel])
+        dx=mu-x
+        cov=scale_cov(C[np.newaxis,:,:]+dx[:,:,np.newaxis]*dx[:,np.newaxis,:],wide)
+    elif method == "knn":
+        if knn is None:
+            knn=max(2*d+1,npart//4)
+        knn=min(knn,npart)
+        C,mu=weighted_cov(x,w)
+        y=x@np.linalg.inv(cholesky(C,ridge)).T
+        dd,idx=cKDTree(y).query(y,k=knn)
+        wn=w[idx]
+        wn=wn/np.sum(wn,axis=1,keepdims=True)
+        xn=x[idx]
+        dx=xn-np.einsum("nk,nki->ni",wn,xn)[:,np.newaxis,:]
+        cov=scale_cov(np.einsum("nk,nki,nkj->nij",wn,dx,dx),wide)
+    else:
+        raise ValueError("local_kernels: unknown method "+str(method))
+    L=cholesky(cov,ridge)
+    logdet=np.sum(np.log(np.diagonal(L,axis1=1,axis2=2)),axis=1)
+    return pack(L),logdet
+
+def support_function(bounds=None,predicate=None):
+    #vectorized inside(x(n,d)) -> bool(n) of the bounds (d,2) and the predicate, None if no support is set
+    if bounds is None and predicate is None:
+        return None
+    b=None if bounds is None else np.reshape(np.asarray(bounds,dtype=np.float64),(-1,2))
+    def inside(x):
+        ok=np.ones(len(x),dtype=bool)
+        if b is not None:
+            ok&=np.all((x>=b[:,0])&(x<=b[:,1]),axis=1)
+        if predicate is not None:
+            ok&=np.asarray(predicate(x),dtype=bool)
+        return ok
+    return inside
+
+def support_mass(xprev,inside,Qmat=None,Lpack=None,bounds=None,nmc=1024,rng=None,nchunk=2**20):
+    """mass of the kernel of each particle in the support, c_j = P(xprev[j] + L_j rn in the support).
+
+    Args:
+       xprev: population (npart,d)
+       inside: support_function
+       Qmat: kernel factor (d*d) common to the particles, or
+       Lpack: packed Cholesky factors of the per-particle kernels (npart,d(d+1)/2)
+       bounds: (d,2) bounds if the support is the bounds only (exact for a diagonal kernel)
+       nmc: number of the Monte Carlo samples (common to the particles)
+       rng: numpy.random.Generator
+       nchunk: max number of the samples evaluated at once
+
+    Returns:
+       c (npart)
+    """
+    xprev=np.reshape(np.asarray(xprev,dtype=np.float64),(len(xprev),-1))
+    npart,d=xprev.shape
+    if Lpack is None:
+        Q=np.reshape(np.asarray(Qmat,dtype=np.float64),(d,d))
+        cov=Q@Q.T
+        if bounds is not None and np.all(cov == np.diag(np.diagonal(cov))):
+            b=np.reshape(np.asarray(bounds,dtype=np.float64),(-1,2))
+            sd=np.sqrt(np.diagonal(cov))
+            return np.prod(norm.cdf((b[:,1]-xprev)/sd)-norm.cdf((b[:,0]-xprev)/sd),axis=1)
+    if rng is None:
+        rng=np.random.default_rng()
+    z=rng.standard_normal((nmc,d))
+    c=np.empty(npart)
+    nb=max(1,nchunk//nmc)
+    for j in range(0,npart,nb):
+        if Lpack is None:
+            y=xprev[j:j+nb,np.newaxis,:]+(z@Q.T)[np.newaxis,:,:]
+        else:
+            y=xprev[j:j+nb,np.newaxis,:]+np.einsum("nij,mj->nmi",unpack(Lpack[j:j+nb],d),z)
+        c[j:j+nb]=np.mean(np.reshape(inside(np.reshape(y,(-1,d))),(-1,nmc)),axis=1)
+    return c
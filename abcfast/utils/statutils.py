@@ -11,31 +11,52 @@ def checkpower2(n):
     if logn - int(logn) > 0.0:
         return True
 
-def genalias_init(parrs):
-    parr=np.array(parrs, np.float32)
-    parr = parr/np.sum(parr)
-
-    Ui = np.ndarray(len(parrs), np.float32)
-    Ki= np.zeros(len(parrs), dtype=np.int32)
-    Li= np.zeros(len(parrs), dtype=np.int32)
-
-    il, ir = 0, 0
-    pairs = list(zip(parr, range(len(parrs))))
-    pairs.sort()
-    for parr, i in pairs:
-        p = parr * len(parrs)
-        while p > 1 and ir < len(Ui):
-            Ki[ir] = i
-            p -= 1.0 - Ui[ir]
-            ir += 1
-        Ui[il] = p
-        Li[il] = i
-        il += 1
-    for i in range(ir, len(parrs)):
-        Ki[i] = 0
-
-    Ui=Ui.astype(np.float32)
-    Li=Li.astype(np.int32)
-    Ki=Ki.astype(np.int32)
-        
-    return Ki,Li,Ui
+def genalias_init(parrs,dtype=np.float32):
+    """alias table for aliasgen (include/genalias.h), vectorized.
+
+    Vose's pairing done by the sweep of Huebschle-Schneider & Sanders (2019):
+    with q=n*p, the light items (q<1) and heavy items (q>=1) are taken in index order.
+    The light item i is aliased to the first heavy item j whose cumulative excess
+    E_j = sum_{t<=j}(q_t - 1) exceeds the cumulative deficit of the preceding lights,
+    D_i = sum_{t<i}(1 - q_t). A heavy item becomes a bucket aliased to the next heavy item
+    once its excess is used up. Both assignments are given by searchsorted over the prefix sums,
+    so there is no python loop nor sort.
+
+    Args:
+       parrs: (unnormalized) probabilities
+       dtype: dtype of Ui. np.float32 for genalias.h, np.float64 for the host sampler.
+
+    Returns:
+       Ki (alias), Li (item), Ui (threshold): bucket k returns Li[k] if Ui[k] >= u else Ki[k]
+    """
+    parr=np.asarray(parrs,dtype=np.float64)
+    n=len(parr)
+    q=parr*(n/np.sum(parr))
+
+    Li=np.arange(n,dtype=np.int32)
+    Ki=np.arange(n,dtype=np.int32)
+    Ui=np.ones(n,dtype=np.float64)
+
+    light=np.nonzero(q<1.0)[0]
+    heavy=np.nonzero(q>=1.0)[0]
+    if len(light)>0 and len(heavy)>0:
+        D=np.zeros(len(light)+1)
+        np.cumsum(1.0-q[light],out=D[1:])
+        E=np.cumsum(q[heavy]-1.0)
+
+        #light buckets
+        j=np.searchsorted(E,D[:-1],side="right")
+        j=np.minimum(j,len(heavy)-1)
+        Ui[light]=q[light]
+        Ki[light]=heavy[j]
+
+        #heavy buckets: residual when the excess is used up (c lights are served)
+        c=np.searchsorted(D,E,side="left")
+        c=np.minimum(c,len(light))
+        Eprev=np.zeros(len(heavy))
+        Eprev[1:]=E[:-1]
+        Ui[heavy]=np.clip(q[heavy]-(D[c]-Eprev),0.0,1.0)
+        Ki[heavy[:-1]]=heavy[1:]
+        Ui[heavy[-1]]=1.0
+
+    return Ki,Li,Ui.astype(dtype)
@@ -0,0 +1,54 @@
+import numpy as np
+import time
+from abcfast.utils.statutils import genalias_init
+
+def genalias_init_loop(parrs):
+    #former python-loop implementation (sorted list of tuples), as the reference
+    parr=np.array(parrs, np.float32)
+    parr = parr/np.sum(parr)
+
+    Ui = np.ndarray(len(parrs), np.float32)
+    Ki= np.zeros(len(parrs), dtype=np.int32)
+    Li= np.zeros(len(parrs), dtype=np.int32)
+
+    il, ir = 0, 0
+    pairs = list(zip(parr, range(len(parrs))))
+    pairs.sort()
+    for parr, i in pairs:
+        p = parr * len(parrs)
+        while p > 1 and ir < len(Ui):
+            Ki[ir] = i
+            p -= 1.0 - Ui[ir]
+            ir += 1
+        Ui[il] = p
+        Li[il] = i
+        il += 1
+    for i in range(ir, len(parrs)):
+        Ki[i] = 0
+    return Ki,Li,Ui
+
+def timeit(f,w,nrep):
+    t=time.perf_counter()
+    for i in range(nrep):
+        f(w)
+    return (time.perf_counter()-t)/nrep
+
+if __name__ == "__main__":
+    print("*******************************************")
+    print("Alias table construction (genalias_init)")
+    print("npart, loop [s], numpy float32 [s], numpy float64 [s]")
+    print("*******************************************")
+    rng=np.random.default_rng(1)
+    nloopmax=2**18 #the loop version is too slow beyond this
+    npart=512
+    while npart <= 2**22:
+        w=rng.random(npart)**4 #weights of a typical ABC-PMC generation (skewed)
+        nrep=max(1,int(2**20/npart))
+        t32=timeit(genalias_init,w,nrep)
+        t64=timeit(lambda w: genalias_init(w,dtype=np.float64),w,nrep)
+        if npart <= nloopmax:
+            tloop="{:.3e}".format(timeit(genalias_init_loop,w,max(1,nrep//16)))
+        else:
+            tloop="-"
+        print(npart,tloop,"{:.3e}".format(t32),"{:.3e}".format(t64))
+        npart=npart*2
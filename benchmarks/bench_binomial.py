@@ -0,0 +1,115 @@
+import numpy as np
+import time
+from scipy import stats
+from abcfast.random import binomialf
+
+#statistical equivalence of the host binomial sampler (abcfast.random.binomial) to the loop of
+#genbinomial.h, and the throughput over n
+#python benchmarks/bench_binomial.py [m]
+#python benchmarks/bench_binomial.py check   (equivalence only)
+#The equivalence is seeded and asserted (chi2 p-value > pmin, mean z within zmax sigma, var z within
+#vtol of 1); the script exits with status 1 if a case fails.
+
+def binomial_loop(n,p,m,rng,nchunk=2**24):
+    #genbinomial.h: the number of the uniforms <= p out of n, per draw
+    k=np.empty(m,dtype=np.int64)
+    nb=max(1,nchunk//max(n,1))
+    for j in range(0,m,nb):
+        k[j:j+nb]=np.count_nonzero(rng.random((min(nb,m-j),n)) <= p,axis=1)
+    return k
+
+def chi2_twosample(x,y):
+    #p-value of the homogeneity of the histograms of x and y (bins with >= 5 expected counts)
+    lo=min(x.min(),y.min())
+    hx=np.bincount(x-lo)
+    hy=np.bincount(y-lo,minlength=len(hx))
+    hx=np.bincount(x-lo,minlength=len(hy))
+    keep=(hx+hy)*min(len(x),len(y))/(len(x)+len(y)) >= 5
+    table=np.array([np.append(hx[keep],np.sum(hx[~keep])),np.append(hy[keep],np.sum(hy[~keep]))])
+    table=table[:,np.sum(table,axis=0) > 0]
+    return stats.chi2_contingency(table)[1]
+
+def rate(f,m,nrep=3):
+    f()
+    t=time.perf_counter()
+    for i in range(nrep):
+        f()
+    return m*nrep/(time.perf_counter()-t)
+
+def equivalence(rng,meq=200000,pmin=1.e-3,zmax=4.0,vtol=0.05):
+    """chi2 homogeneity with the genbinomial.h loop per (n,p), and z of the per-element (n,p) draws.
+
+    Returns:
+       list of the failed checks
+    """
+    failed=[]
+    cases=[(1,0.3),(10,0.05),(10,0.5),(50,0.7),(100,0.3),(1000,0.3),(1000,0.98),(5000,0.01)]
+    print("*******************************************")
+    print("Equivalence to the genbinomial.h loop, m =",meq)
+    print("n, p, p-value: table/numpy, ntry=1, ntry=4 (chi2 homogeneity with the loop)")
+    print("*******************************************")
+    for n,p in cases:
+        ref=binomial_loop(n,p,meq,rng)
+        pv=[chi2_twosample(binomialf(n,p,rng,meq,ntry=ntry),ref) for ntry in [None,1,4]]
+        print(n,p," ".join("{:.3f}".format(x) for x in pv))
+        failed+=["n="+str(n)+" p="+str(p)+" ntry="+str(ntry)+": chi2 p-value="+str(x) for ntry,x in zip([None,1,4],pv) if not x > pmin]
+    nn=rng.integers(1,2000,meq)
+    pp=rng.random(meq)
+    ref=np.concatenate([binomial_loop(int(a),b,1,rng) for a,b in zip(nn[:20000],pp[:20000])])
+    for ntry in [None,1,4]:
+        k=binomialf(nn[:20000],pp[:20000],rng,ntry=ntry)
+        z=(k-ref)/np.sqrt(2.0*nn[:20000]*pp[:20000]*(1.0-pp[:20000])+1.e-12)
+        zmean,zerr,zvar=np.mean(z),np.std(z)/np.sqrt(len(z)),np.var(z)
+        print("per-element (n,p), ntry =",ntry,": mean z = {:.4f} +- {:.4f}, var z = {:.4f} (1)".format(zmean,zerr,zvar))
+        if not abs(zmean) < zmax*zerr:
+            failed.append("per-element ntry="+str(ntry)+": mean z="+str(zmean))
+        if not abs(zvar-1.0) < vtol:
+            failed.append("per-element ntry="+str(ntry)+": var z="+str(zvar))
+    #edge cases: 0 for n <= 0 or p <= 0, n for p >= 1, on every path
+    nn=np.array([-5,0,-5,0,7,7,7,-5])
+    pp=np.array([0.7,0.7,0.3,1.0,0.0,1.0,1.5,-0.2])
+    expect=np.array([0,0,0,0,0,7,7,0])
+    for ntry in [None,1,4]:
+        k=binomialf(nn,pp,rng,ntry=ntry)
+        print("edge cases, ntry =",ntry,":",k)
+        if not np.array_equal(k,expect):
+            failed.append("edge cases ntry="+str(ntry)+": "+str(k)+" (expected "+str(expect)+")")
+        for a,b,e in zip(nn,pp,expect):
+            ks=binomialf(int(a),float(b),rng,3,ntry=ntry)
+            if not np.all(ks == e):
+                failed.append("edge case n="+str(a)+" p="+str(b)+" ntry="+str(ntry)+" (scalar): "+str(ks))
+    for f in failed:
+        print("FAILED:",f)
+    return failed
+
+if __name__ == "__main__":
+    import sys
+    check = len(sys.argv) > 1 and sys.argv[1] == "check"
+    m=int(sys.argv[1]) if len(sys.argv) > 1 and not check else 2**20
+    rng=np.random.default_rng(1)
+    failed=equivalence(rng)
+    if check:
+        sys.exit(1 if len(failed) > 0 else 0)
+
+    out=np.empty(m,dtype=np.int64)
+    print("*******************************************")
+    print("Binomial samplers [samples/s], m =",m)
+    print("n, p, binomialf, btpe(ntry=1), btpe(ntry=4), genbinomial.h loop, numpy Generator, scipy.stats")
+    print("*******************************************")
+    for n in [10,100,1000,10000,100000,1000000]:
+        p=0.3
+        r0=rate(lambda: binomialf(n,p,rng,out=out),m)
+        r1=rate(lambda: binomialf(n,p,rng,out=out,ntry=1),m)
+        r4=rate(lambda: binomialf(n,p,rng,out=out,ntry=4),m)
+        ml=max(1,min(m,2**26//n))
+        rl=rate(lambda: binomial_loop(n,p,ml,rng),ml,1)
+        rn=rate(lambda: rng.binomial(n,p,m),m)
+        rs=rate(lambda: stats.binom.rvs(n,p,size=m,random_state=rng),m)
+        print(n,p," ".join("{:.3e}".format(x) for x in [r0,r1,r4,rl,rn,rs]))
+    nn=rng.integers(1,100000,m)
+    pp=rng.random(m)
+    print("per-element (n,p):",
+          " ".join("{:.3e}".format(rate(lambda: binomialf(nn,pp,rng,out=out,ntry=ntry),m)) for ntry in [None,1,4]),"-",
+          "{:.3e}".format(rate(lambda: rng.binomial(nn,pp),m)),
+          "{:.3e}".format(rate(lambda: stats.binom.rvs(nn,pp,random_state=rng),m)))
+    sys.exit(1 if len(failed) > 0 else 0)
@@ -0,0 +1,43 @@
+import numpy as np
+import time
+from scipy import stats
+from abcfast.random import gammaf, betaf
+
+#throughput of the host gamma and beta samplers (abcfast.random.gamma) over the shape
+#python benchmarks/bench_gamma.py [n]
+
+def rate(f,n,nrep=3):
+    f()
+    t=time.perf_counter()
+    for i in range(nrep):
+        f()
+    return n*nrep/(time.perf_counter()-t)
+
+if __name__ == "__main__":
+    import sys
+    n=int(sys.argv[1]) if len(sys.argv) > 1 else 2**20
+    rng=np.random.default_rng(1)
+    out=np.empty(n)
+    print("*******************************************")
+    print("Gamma samplers [samples/s], n =",n)
+    print("shape, gammaf, marsaglia_tsang(ntry=1), marsaglia_tsang(ntry=4), scipy.stats, KS p-value(ntry=1)")
+    print("*******************************************")
+    for a in [0.05,0.4,1.0,2.5,10.0,1000.0]:
+        r=[rate(lambda: gammaf(a,2.0,rng,out=out,ntry=ntry),n) for ntry in [None,1,4]]
+        r.append(rate(lambda: stats.gamma.rvs(a,scale=0.5,size=n,random_state=rng),n))
+        pv=stats.kstest(gammaf(a,2.0,rng,n,ntry=1),stats.gamma(a,scale=0.5).cdf).pvalue
+        print(a," ".join("{:.3e}".format(x) for x in r),"{:.3f}".format(pv))
+    a=rng.uniform(0.05,20.0,n)
+    r=[rate(lambda: gammaf(a,2.0,rng,out=out,ntry=ntry),n) for ntry in [None,1,4]]
+    r.append(rate(lambda: stats.gamma.rvs(a,scale=0.5,random_state=rng),n))
+    pv=stats.kstest(stats.gamma.cdf(gammaf(a,2.0,rng,ntry=1),a,scale=0.5),"uniform").pvalue
+    print("per-element shape in [0.05,20]:"," ".join("{:.3e}".format(x) for x in r),"{:.3f}".format(pv))
+    print("*******************************************")
+    print("Beta samplers [samples/s]")
+    print("alpha, beta, betaf, betaf(ntry=1), betaf(ntry=4), scipy.stats, KS p-value(ntry=1)")
+    print("*******************************************")
+    for al,be in [(0.3,0.5),(1.2,1.3),(5.0,2.0)]:
+        r=[rate(lambda: betaf(al,be,rng,out=out,ntry=ntry),n) for ntry in [None,1,4]]
+        r.append(rate(lambda: stats.beta.rvs(al,be,size=n,random_state=rng),n))
+        pv=stats.kstest(betaf(al,be,rng,n,ntry=1),stats.beta(al,be).cdf).pvalue
+        print(al,be," ".join("{:.3e}".format(x) for x in r),"{:.3f}".format(pv))
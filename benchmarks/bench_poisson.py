@@ -0,0 +1,69 @@
+import numpy as np
+import time
+from scipy import stats
+from scipy.special import gammaln
+from abcfast.random import poissonf
+
+#throughput of the host Poisson sampler (abcfast.random.poisson) over lambda
+#python benchmarks/bench_poisson.py [n]
+
+NMAXPOI=10000
+
+def genpoisson(p,n,rng):
+    #numpy port of genpoisson.h (inversion outward from the mode), vectorized over the pending draws
+    m=int(p)
+    pu=np.exp(-p+m*np.log(p)-gammaln(m+1.0))
+    x=np.full(n,-1,dtype=np.int64)
+    idx=np.arange(n)
+    V=rng.random(n)-pu
+    pl=pu
+    Xu=Xl=m
+    for i in range(NMAXPOI):
+        done=V <= 0.0
+        x[idx[done]]=Xu
+        idx,V=idx[~done],V[~done]
+        if len(idx) == 0:
+            break
+        if Xl > 0:
+            pl=pl*float(Xl)/p
+            Xl=Xl-1
+            V=V-pl
+            done=V < 0.0
+            x[idx[done]]=Xl
+            idx,V=idx[~done],V[~done]
+        Xu=Xu+1
+        pu=pu*p/float(Xu)
+        V=V-pu
+    return x
+
+def rate(f,n,nrep=3):
+    f()
+    t=time.perf_counter()
+    for i in range(nrep):
+        f()
+    return n*nrep/(time.perf_counter()-t)
+
+if __name__ == "__main__":
+    import sys
+    n=int(sys.argv[1]) if len(sys.argv) > 1 else 2**20
+    rng=np.random.default_rng(1)
+    out=np.empty(n,dtype=np.int64)
+    print("*******************************************")
+    print("Poisson samplers [samples/s], n =",n)
+    print("lambda, poissonf, ptrs(ntry=1), ptrs(ntry=4), genpoisson.h port, numpy Generator, scipy.stats")
+    print("*******************************************")
+    for lam in [0.1,1.0,3.0,10.0,30.0,100.0,1.e3,1.e4,1.e5]:
+        r0=rate(lambda: poissonf(lam,rng,out=out),n)
+        r1=rate(lambda: poissonf(lam,rng,out=out,ntry=1),n)
+        r4=rate(lambda: poissonf(lam,rng,out=out,ntry=4),n)
+        rg=rate(lambda: genpoisson(lam,n,rng),n,1) if lam <= 1.e4 else float("nan")
+        rn=rate(lambda: rng.poisson(lam,n),n)
+        rs=rate(lambda: stats.poisson.rvs(lam,size=n,random_state=rng),n)
+        print(lam," ".join("{:.3e}".format(r) for r in [r0,r1,r4,rg,rn,rs]))
+    lam=10.0**rng.uniform(-1,5,n)
+    print("per-element lambda in [0.1,1e5]:",
+          "{:.3e}".format(rate(lambda: poissonf(lam,rng,out=out),n)),
+          "{:.3e}".format(rate(lambda: poissonf(lam,rng,out=out,ntry=1),n)),
+          "{:.3e}".format(rate(lambda: poissonf(lam,rng,out=out,ntry=4),n)),"-",
+          "{:.3e}".format(rate(lambda: rng.poisson(lam),n)),
+          "{:.3e}".format(rate(lambda: stats.poisson.rvs(lam,random_state=rng),n)))
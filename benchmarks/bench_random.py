@@ -0,0 +1,60 @@
+import numpy as np
+import time
+from scipy import stats
+import abcfast.random as ar
+
+#samples per second of the host samplers (abcfast.random) and of scipy.stats rvs
+#python benchmarks/bench_random.py [n]
+
+def rate(f,n,nrep):
+    f() #warm up
+    t=time.perf_counter()
+    for i in range(nrep):
+        f()
+    return n*nrep/(time.perf_counter()-t)
+
+if __name__ == "__main__":
+    import sys
+    n=int(sys.argv[1]) if len(sys.argv) > 1 else 2**20
+    nrep=4
+    rng=np.random.default_rng(1)
+    out=np.empty(n)
+    iout=np.empty(n,dtype=np.int64)
+    out2=np.empty((n,2))
+    parrs=rng.random(1000)**4
+    Ki,Li,Ui=ar.alias_init(parrs)
+    hparam=np.array([0.0,0.0,1.0,0.6,0.7])
+    cov=np.array([[1.0,0.7],[0.7,0.6]])
+    Qmat=ar.qmat(cov)
+    cases=[
+        ("normal",lambda: ar.normf(1.0,2.0,rng,out=out),
+         lambda: stats.norm.rvs(1.0,2.0,size=n,random_state=rng)),
+        ("norm2d",lambda: ar.norm2df(hparam,rng,out=out2),
+         lambda: stats.multivariate_normal.rvs([0.0,0.0],cov,size=n,random_state=rng)),
+        ("normal given cov",lambda: ar.normgivencov([0.0,0.0],Qmat,rng,out=out2),
+         lambda: stats.multivariate_normal.rvs([0.0,0.0],cov,size=n,random_state=rng)),
+        ("gamma a=0.4",lambda: ar.gammaf(0.4,2.0,rng,out=out),
+         lambda: stats.gamma.rvs(0.4,scale=0.5,size=n,random_state=rng)),
+        ("gamma a=5",lambda: ar.gammaf(5.0,2.0,rng,out=out),
+         lambda: stats.gamma.rvs(5.0,scale=0.5,size=n,random_state=rng)),
+        ("beta",lambda: ar.betaf(1.2,1.3,rng,out=out),
+         lambda: stats.beta.rvs(1.2,1.3,size=n,random_state=rng)),
+        ("exponential",lambda: ar.expf(0.1,rng,out=out),
+         lambda: stats.expon.rvs(scale=10.0,size=n,random_state=rng)),
+        ("rayleigh",lambda: ar.rayleighf(rng,out=out),
+         lambda: stats.rayleigh.rvs(size=n,random_state=rng)),
+        ("poisson lambda=3.5",lambda: ar.poissonf(3.5,rng,out=iout),
+         lambda: stats.poisson.rvs(3.5,size=n,random_state=rng)),
+        ("binomial n=1000",lambda: ar.binomialf(1000,0.3,rng,out=iout),
+         lambda: stats.binom.rvs(1000,0.3,size=n,random_state=rng)),
+        ("alias 1000 items",lambda: ar.aliasgen(Ki,Li,Ui,n,rng,out=iout),
+         lambda: stats.rv_discrete(values=(np.arange(1000),parrs/np.sum(parrs))).rvs(size=n,random_state=rng)),
+    ]
+    print("*******************************************")
+    print("Host samplers, n =",n)
+    print("sampler, abcfast.random [1/s], scipy.stats [1/s], ratio")
+    print("*******************************************")
+    for name,f,g in cases:
+        ra=rate(f,n,nrep)
+        rs=rate(g,n,nrep)
+        print(name,"{:.3e}".format(ra),"{:.3e}".format(rs),"{:.2f}".format(ra/rs))
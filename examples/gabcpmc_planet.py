@@ -1,21 +1,38 @@
 from abcfast.gabcpmc import *
 from abcfast.utils import statutils
 
-def ABCfrp(Pmin=256.0,Pmax=500.0,Rpmin=1.75,Rpmax=2.0):
+def load_catalog():
+    #stellar catalog (aux) and KOI catalog, loaded once and shared by the bins
+    #the CSVs are converted to a cached columnar form on the first call (see abcfast/catalog.py)
     import numpy as np
-    import matplotlib.pyplot as plt
-    from numpy import random
-    import time
-    import sys
-    import pandas as pd
+    from abcfast.catalog import Catalog
 
-    tstart=time.time()
-    
-    print("*******************************************")
-    print("GPU ABC PMC Method.")
-    print("This code demonstrates the Kepler planet occurence inference")
-    print("*******************************************")
+    observed_data=Catalog("data/koi_berger.csv")
+    #observed_data=Catalog("/home/kawahara/exocal/exosnow/data/q1_q17_dr25_koi.csv")
+    mask=observed_data.equals("koi_pdisposition","CANDIDATE")
+    mask&=observed_data.within("koi_steff",4000,7000)
+    Pkoi=observed_data["koi_period"][mask]
+    Rpkoi=observed_data["rpgaia"][mask]
+    #Rpkoi=observed_data["koi_prad"][mask]
 
+    ## input aux from the stellar catalog
+    planet_data=Catalog("data/kepler_berger.csv")
+    names=["radiusnew","mass","rrmscdpp04p5","mesthres04p5","dataspan","dutycycle"]
+    smask=planet_data.finite(names)&(planet_data["mass"]>0.0)&(planet_data["radiusnew"]>0.0)
+
+    #SELECT Main-Sequence
+    smask&=planet_data.within("teffnew",4000.0,7000.0)&(planet_data["logg"]>4.0)
+
+    nstar=int(np.count_nonzero(smask))
+    print("NSTAR=",nstar)
+    print("Do not forget to include errors of Rstar in future.")
+    #aux (rstar,mstar,sigCDPP,mesthre,Tdur,fduty) is gathered from the columns by each bin (setup_frp)
+    return {"Pkoi":Pkoi,"Rpkoi":Rpkoi,"stars":planet_data,"names":names,"smask":smask,"nstar":nstar}
+
+def setup_frp(params,catalog):
+    #ABCpmc of a (P, Rp) bin
+    import numpy as np
+    Pmin,Pmax,Rpmin,Rpmax=params["Pmin"],params["Pmax"],params["Rpmin"],params["Rpmax"]
 
     # start ABCpmc 
     abc=ABCpmc()
@@ -26,60 +43,20 @@ def ABCfrp(Pmin=256.0,Pmax=500.0,Rpmin=1.75,Rpmax=2.0):
     # data and the summary statistics
     abc.nsample = 512
     abc.ndata = 1
-    observed_data=pd.read_csv("data/koi_berger.csv",delimiter=",")
-    #observed_data=pd.read_csv("/home/kawahara/exocal/exosnow/data/q1_q17_dr25_koi.csv",delimiter=",",comment="#")
-    
-    Pkoi=observed_data["koi_period"]
-    Rpkoi=observed_data["rpgaia"]
-    #Rpkoi=observed_data["koi_prad"]
-    teffkoi=observed_data["koi_steff"]
-    mask=observed_data["koi_pdisposition"]=="CANDIDATE"
-    mask=mask&(Pkoi>Pmin)&(Pkoi<Pmax)&(Rpkoi>Rpmin)&(Rpkoi<Rpmax)
-    mask=mask&(teffkoi>4000)&(teffkoi<7000)
-
-    
-    Yobs=len(observed_data[mask])
+    Pkoi=catalog["Pkoi"]
+    Rpkoi=catalog["Rpkoi"]
+    Yobs=np.sum((Pkoi>Pmin)&(Pkoi<Pmax)&(Rpkoi>Rpmin)&(Rpkoi<Rpmax))
 
     Ysum = np.float32(Yobs)
     abc.Ysm = np.array([Ysum])
 
-#    print(Ysum)
-#    sys.exit()
     #set prior parameters
 
     initep=Ysum*1.e-4
 
     
     # input model/prior
-
-    ## input aux from the stellar catalog
-    planet_data=pd.read_csv("data/kepler_berger.csv")
-    rstar=planet_data["radiusnew"].values
-    mstar=planet_data["mass"].values
-    sigCDPP=planet_data["rrmscdpp04p5"].values
-    mesthre=planet_data["mesthres04p5"].values
-    Tdur = planet_data["dataspan"].values
-    fduty = planet_data["dutycycle"].values
-    
-    mask=(sigCDPP==sigCDPP)&(mstar>0.0)&(rstar>0.0)&(mesthre==mesthre)&(Tdur==Tdur)&(fduty==fduty)
-
-    #SELECT Main-Sequence
-    teff=planet_data["teffnew"].values
-    logg=planet_data["logg"].values
-    mask=mask&(teff<7000.0)&(teff>4000.0)&(logg>4.0)
-    
-    rstar=rstar[mask]
-    mstar=mstar[mask]
-    sigCDPP=sigCDPP[mask]
-    mesthre=mesthre[mask]
-    Tdur=Tdur[mask]
-    fduty=fduty[mask]
-    
-    nstar=len(rstar)
-    
-    abc.aux=np.concatenate([rstar,mstar,sigCDPP,mesthre,Tdur,fduty])
-    print("NSTAR=",nstar)
-    print("Do not forget to include errors of Rstar in future.")
+    nstar=catalog["nstar"]
     
     logPmin=np.log(Pmin)
     logPmax=np.log(Pmax)
@@ -95,15 +72,16 @@ def ABCfrp(Pmin=256.0,Pmax=500.0,Rpmin=1.75,Rpmax=2.0):
     safefac=5.0 # safe factor ~ 1/(1-emax) emax=0.8
     pcrit=safefac*RSOLAU*RM3*(Pmin/365.242189)**(-2.0/3.0)
 
+    #the bin values follow the stellar catalog in aux (not #define), so the kernel source is the same for all the bins
+    aux=np.empty(6*nstar+5,dtype=np.float32)
+    catalog["stars"].gather(catalog["names"],catalog["smask"],out=aux[:6*nstar])
+    aux[6*nstar:]=[pcrit,logPmin,logPmax,logRpmin,logRpmax]
+    abc.aux=aux
+
     abc.nparam=1
     abc.ntcommon=1 #use 1 thread common value in shared memory for Npick
     abc.model=\
     "#define Nstars "+str(nstar)+"\n"\
-    +"#define PCRIT "+str(pcrit)+"\n"\
-    +"#define logPmin "+str(logPmin)+"\n"\
-    +"#define logPmax "+str(logPmax)+"\n"\
-    +"#define logRpmin "+str(logRpmin)+"\n"\
-    +"#define logRpmax "+str(logRpmax)+"\n"\
     +"#define PCHANGE "+str(pchange)+"\n"\
     +""" 
 
@@ -135,6 +113,29 @@ def ABCfrp(Pmin=256.0,Pmax=500.0,Rpmin=1.75,Rpmax=2.0):
     """
 
     abc.epsilon_list = np.array([initep,initep*0.9,initep*0.8])
+    return abc
+
+def frp_summary(abc):
+    import numpy as np
+    frp=abc.x
+    return {"frpmed":np.median(frp),"frpmin":np.percentile(frp,15.87),"frpmax":np.percentile(frp,84.13)}
+
+def ABCfrp(Pmin=256.0,Pmax=500.0,Rpmin=1.75,Rpmax=2.0):
+    import numpy as np
+    import matplotlib.pyplot as plt
+    from numpy import random
+    import time
+    import sys
+
+    tstart=time.time()
+    
+    print("*******************************************")
+    print("GPU ABC PMC Method.")
+    print("This code demonstrates the Kepler planet occurence inference")
+    print("*******************************************")
+
+
+    abc=setup_frp({"Pmin":Pmin,"Pmax":Pmax,"Rpmin":Rpmin,"Rpmax":Rpmax},load_catalog())
 
     #initial run of abc pmc
     abc.check_preparation()
@@ -175,8 +176,18 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='compute frp')
     parser.add_argument('-p', nargs=2, help='Pmin, Pmax', type=float)
     parser.add_argument('-r', nargs=2, help='Rpmin, Rpmax', type=float)
+    parser.add_argument('-g', help='grid file of the bins (Pmin,Pmax,Rpmin,Rpmax per line) for a sweep', type=str)
+    parser.add_argument('-o', help='output table of the sweep', type=str, default='frp_sweep.csv')
 
     args = parser.parse_args()
+    if args.g is not None:
+        #sweep over the bins, the catalogs are loaded once and the completed bins in the table are skipped
+        from abcfast.sweep import Sweep
+        grid=np.atleast_2d(np.loadtxt(args.g,delimiter=","))
+        bins=[{"Pmin":g[0],"Pmax":g[1],"Rpmin":g[2],"Rpmax":g[3]} for g in grid]
+        Sweep(setup_frp,args.o,shared=load_catalog(),summary=frp_summary).run(bins)
+        sys.exit()
+
     Pmin=args.p[0]
     Pmax=args.p[1]
     Rpmin=args.r[0]
@@ -19,17 +19,21 @@ k= +NDATA*NSAMPLE for sumulated data Ysim, +NPARAM for the model parameters
 
 #include "genalias.h"
 
+/* scale of the distance per data component (summary.Distance.kernel_source) */
+#ifndef DSCALE
+#define DSCALE(m) 1.0f
+#endif
+
 extern "C"{
 
-  __global__ void abcpmc(float* x, float* xprev, float* Ysm, float epsilon, int* Ki, int* Li, float* Ui, float* Qmat, int seed, float* dist, int* ntry, float* aux){
+  __global__ void abcpmc(float* x, float* xprev, float* Ysm, float epsilon, int* Ki, int* Li, float* Ui, float* Qmat, int seed, float* dist, int* ntry, float* aux, int* slot, int npart, int maxtry){
 
     curandState s;
     int cnt = 0;
     float p;
     float rho;
     int nthread = blockDim.x;
-    int npart = gridDim.x;
-    int iblock = blockIdx.x;
+    int iblock = (slot == NULL) ? blockIdx.x : slot[blockIdx.x]; /* particle of this block (recovery: failed slots) */
     int ithread = threadIdx.x;
     unsigned long id = iblock*NSAMPLE + ithread;
     float uni;
@@ -45,13 +49,13 @@ extern "C"{
 
     /* limitter */
     cnt++;
-    if(cnt > MAXTRYX){
+    if(cnt > maxtry){
       if(ithread==0){
 	printf("EXCEED MAXTRYX. iblock=%d \n",iblock);
 	for (int m=0; m<NPARAM; m++){
 	    x[NPARAM*iblock + m] = CUDART_NAN_F;
 	}
-	ntry[iblock]=MAXTRYX;	  
+	ntry[iblock]=maxtry;	  
       }
       return;
     }
@@ -120,7 +124,7 @@ extern "C"{
     /* ===================================================== */
     rho = 0.0;
     for (int m=0; m<NDATA; m++){
-      rho += abs(cache[m] - Ysm[m])/NSAMPLE;     
+      rho += abs(cache[m] - Ysm[m])/NSAMPLE/DSCALE(m);
     }
 
     /* ----------------------------------------------------- */
@@ -19,9 +19,14 @@ k= +NDATA*NSAMPLE for sumulated data Ysim, +NPARAM for the model parameters
 
 */
 
+/* scale of the distance per data component (summary.Distance.kernel_source) */
+#ifndef DSCALE
+#define DSCALE(m) 1.0f
+#endif
+
 
 extern "C"{
-  __global__ void abcpmc_init(float* x, float* Ysm, float epsilon, int seed, float* dist, int* ntry, float* aux){
+  __global__ void abcpmc_init(float* x, float* Ysm, float epsilon, int seed, float* dist, int* ntry, float* aux, int* slot, int maxtry){
 
     curandState s;
     int cnt = 0;
@@ -29,7 +34,7 @@ extern "C"{
     float rho;
     int nthread = blockDim.x;
     int isample;
-    int iblock = blockIdx.x;
+    int iblock = (slot == NULL) ? blockIdx.x : slot[blockIdx.x]; /* particle of this block (recovery: failed slots) */
     int ithread = threadIdx.x;
     unsigned long id = iblock*nthread + ithread;
     float param[NPARAM];
@@ -41,14 +46,14 @@ extern "C"{
 
     /* limitter */
       cnt++;
-      if(cnt > MAXTRYX){
+      if(cnt > maxtry){
 	
 	if(ithread==0){
 	  printf("EXCEED MAXTRYX. iblock=%d \n",iblock);
 	  for (int m=0; m<NPARAM; m++){
 	    x[NPARAM*iblock + m] = CUDART_NAN_F;
 	  }
-	ntry[iblock]=MAXTRYX;
+	ntry[iblock]=maxtry;
         
 	}
 	return;
@@ -113,7 +118,7 @@ extern "C"{
       /* ===================================================== */
       rho = 0.0;
       for (int m=0; m<NDATA; m++){
-	rho += abs(cache[m] - Ysm[m])/NSAMPLE;
+	rho += abs(cache[m] - Ysm[m])/NSAMPLE/DSCALE(m);
       }      
       /* ----------------------------------------------------- */
 
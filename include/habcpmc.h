@@ -27,21 +27,20 @@ k= +NDATA*NSAMPLE for sumulated data Ysim, +NHPARAM for the prior parmeters, +NS
 #include "genalias.h"
 
 extern "C"{
-  __global__ void habcpmc(float* x, float* xprev, float* z,float* Ysm, float epsilon, int* Ki, int* Li, float* Ui, float* Qmat, int seed, float* dist, int* ntry){
+  __global__ void habcpmc(float* x, float* xprev, float* z,float* Ysm, float epsilon, int* Ki, int* Li, float* Ui, float* Qmat, int seed, float* dist, int* ntry, int* slot, int npart, int maxtry){
 
     curandState s;
     int cnt = 0;
     float p;
     float rho;
     int nthread = blockDim.x;
-    int npart = gridDim.x;
 
     float uni;
     int isel;
     int isample;
     int isubject;
     int isubdat;
-    int iblock = blockIdx.x;
+    int iblock = (slot == NULL) ? blockIdx.x : slot[blockIdx.x]; /* particle of this block (recovery: failed slots) */
     int ithread = threadIdx.x;
     unsigned long id = iblock*nthread + ithread;
     float param[NPARAM];
@@ -56,7 +55,7 @@ extern "C"{
 
     /* limitter */
       cnt++;
-      if(cnt > MAXTRYX){
+      if(cnt > maxtry){
 	
 	if(ithread==0){
 	  printf("EXCEED MAXTRYX. iblock=%d \n",iblock);
@@ -64,7 +63,7 @@ extern "C"{
 	  for (int m=0; m<NHPARAM; m++){
 	    x[NHPARAM*iblock + m] = CUDART_NAN_F;
 	  }
-	ntry[iblock]=MAXTRYX;
+	ntry[iblock]=maxtry;
         
 	}
 	return;
@@ -25,7 +25,7 @@ k= +NDATA*NSAMPLE for sumulated data Ysim, +NHPARAM for the prior parmeters, +NS
 */
 
 extern "C"{
-  __global__ void habcpmc_init(float* x, float* Ysm, float epsilon, int seed, float* dist, int* ntry){
+  __global__ void habcpmc_init(float* x, float* Ysm, float epsilon, int seed, float* dist, int* ntry, int* slot, int maxtry){
 
     curandState s;
     int cnt = 0;
@@ -35,7 +35,7 @@ extern "C"{
     int isample;
     int isubject;
     int isubdat;
-    int iblock = blockIdx.x;
+    int iblock = (slot == NULL) ? blockIdx.x : slot[blockIdx.x]; /* particle of this block (recovery: failed slots) */
     int ithread = threadIdx.x;
     unsigned long id = iblock*nthread + ithread;
     float param[NPARAM];
@@ -48,7 +48,7 @@ extern "C"{
 
     /* limitter */
       cnt++;
-      if(cnt > MAXTRYX){
+      if(cnt > maxtry){
 	
 	if(ithread==0){
 	  printf("EXCEED MAXTRYX. iblock=%d \n",iblock);
@@ -56,7 +56,7 @@ extern "C"{
 	  for (int m=0; m<NHPARAM; m++){
 	    x[NHPARAM*iblock + m] = CUDART_NAN_F;
 	  }
-	ntry[iblock]=MAXTRYX;
+	ntry[iblock]=maxtry;
         
 	}
 	return;
@@ -45,9 +45,16 @@ pow(b,a)=0.98**4.65=0.9103350239605226
 14.365526844616904
 */
 
+/* the bin values follow the stellar catalog in aux, so that one compiled kernel serves all the bins */
+#define PCRIT (aux[6*Nstars])
+#define logPmin (aux[6*Nstars + 1])
+#define logPmax (aux[6*Nstars + 2])
+#define logRpmin (aux[6*Nstars + 3])
+#define logRpmax (aux[6*Nstars + 4])
+
 __device__ void model(float* Ysim, float* param, curandState* s, float* aux, int isample){
   
-  /* aux = stellar radius, CDPP, observing duration */
+  /* aux = stellar radius, mass, CDPP, MES threshold, observing duration, duty cycle (Nstars each), pcrit, logPmin, logPmax, logRpmin, logRpmax */
   float rstar;
   float mstar;
   float sigCDPP;